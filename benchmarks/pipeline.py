@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""Benchmark steemvoter end to end on a synthetic chain.
+
+Synthetic blocks of comment and vote operations are fed through the
+monitor's operation handlers, the database and Voter.vote_for_comments(),
+with an in-process fake RPC node in place of a Steem node.
+
+Reports operations per second, latency percentiles for each stage and
+peak RSS as JSON, so that runs can be compared.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from steemvote.blocks import STEEMIT_BLOCK_INTERVAL
+from steemvote.config import Config
+from steemvote.models import Author, Delegate, Priority, make_identifier
+from steemvote.monitor import Monitor
+from steemvote.voter import Voter
+
+# Throwaway key used only for benchmarking.
+BENCHMARK_WIF = '5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3'
+BENCHMARK_ACCOUNT = 'steemvote'
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+
+class FakeRPC(object):
+    """In-process stand-in for a Steem node.
+
+    Comment content is kept current with the operations that the
+    synthetic chain produces. Broadcast votes are included in the
+    next block.
+    """
+    def __init__(self):
+        # {identifier: content, ...}
+        self.contents = {}
+        self.head_block_number = 0
+        # Vote operations that have been broadcast but not included in a block.
+        self.broadcast_ops = []
+        self.calls = 0
+
+    def add_comment(self, op, created):
+        identifier = make_identifier(op['author'], op['permlink'])
+        category = op['parent_permlink'] if not op['parent_author'] else 'steem'
+        self.contents[identifier] = {
+            'id': len(self.contents) + 1,
+            'author': op['author'],
+            'permlink': op['permlink'],
+            'category': category,
+            'parent_author': op['parent_author'],
+            'parent_permlink': op['parent_permlink'],
+            'title': op['title'],
+            'body': op['body'],
+            'json_metadata': op['json_metadata'],
+            'created': format_time(created),
+            'last_update': format_time(created),
+            'active': format_time(created),
+            'last_payout': '1970-01-01T00:00:00',
+            'cashout_time': format_time(created + 24 * 60 * 60),
+            'depth': 1 if op['parent_author'] else 0,
+            'children': 0,
+            'net_rshares': 0,
+            'abs_rshares': 0,
+            'vote_rshares': 0,
+            'total_payout_value': '0.000 SBD',
+            'curator_payout_value': '0.000 SBD',
+            'pending_payout_value': '0.000 SBD',
+            'total_pending_payout_value': '0.000 STEEM',
+            'max_accepted_payout': '1000000.000 SBD',
+            'promoted': '0.000 SBD',
+            'percent_steem_dollars': 10000,
+            'allow_replies': True,
+            'allow_votes': True,
+            'allow_curation_rewards': True,
+            'url': '/%s/@%s/%s' % (category, op['author'], op['permlink']),
+            'root_title': op['title'],
+            'active_votes': [],
+            'replies': [],
+        }
+
+    def add_vote(self, op, time):
+        content = self.contents.get(make_identifier(op['author'], op['permlink']))
+        if content:
+            content['active_votes'].append({'voter': op['voter'], 'weight': 0, 'rshares': 0,
+                    'percent': op['weight'], 'reputation': 0, 'time': format_time(time)})
+
+    def get_content(self, author, permlink):
+        self.calls += 1
+        return self.contents.get(make_identifier(author, permlink), {'author': ''})
+
+    def get_contents(self, pairs):
+        self.calls += 1
+        return [self.contents.get(make_identifier(author, permlink), {'author': ''}) for author, permlink in pairs]
+
+    def get_dynamic_global_properties(self):
+        self.calls += 1
+        return {
+            'head_block_number': self.head_block_number,
+            'head_block_id': '%08x' % self.head_block_number + '0' * 32,
+            'last_irreversible_block_num': self.head_block_number,
+        }
+
+    def get_account(self, name):
+        self.calls += 1
+        return {'name': name, 'voting_power': 10000, 'last_vote_time': '1970-01-01T00:00:00'}
+
+    def broadcast_transaction(self, tx, api=None):
+        self.calls += 1
+        for op in tx['operations']:
+            if op[0] == 'vote':
+                self.broadcast_ops.append(op)
+
+    def take_broadcast_ops(self):
+        ops, self.broadcast_ops = self.broadcast_ops, []
+        return ops
+
+class FakeSteem(object):
+    def __init__(self, rpc):
+        self.rpc = rpc
+
+class SyntheticChain(object):
+    """Generates blocks with a realistic mix of comment and vote operations.
+
+    A small fraction of posts go viral and receive thousands of votes
+    over the following blocks.
+    """
+    def __init__(self, rpc, users, authors, delegates, comments_per_block, votes_per_block,
+            viral_fraction, viral_votes, seed=0):
+        self.rpc = rpc
+        self.rng = random.Random(seed)
+        self.users = users
+        self.authors = authors
+        self.delegates = delegates
+        self.comments_per_block = comments_per_block
+        self.votes_per_block = votes_per_block
+        self.viral_fraction = viral_fraction
+        self.viral_votes = viral_votes
+        # Identifiers of existing comments.
+        self.comments = []
+        # [[author, permlink, remaining_votes], ...]
+        self.viral_posts = []
+        self.sequence = 0
+
+    def random_author(self):
+        # Configured authors write a share of the comments, as they would on a real chain.
+        if self.rng.random() < 0.2:
+            return self.rng.choice(self.authors)
+        return self.rng.choice(self.users)
+
+    def random_voter(self):
+        if self.rng.random() < 0.05:
+            return self.rng.choice(self.delegates)
+        return self.rng.choice(self.users)
+
+    def comment_op(self):
+        self.sequence += 1
+        author = self.random_author()
+        permlink = 'post-%d' % self.sequence
+        op = {
+            'parent_author': '',
+            'parent_permlink': self.rng.choice(['steem', 'life', 'photography', 'spam']),
+            'author': author,
+            'permlink': permlink,
+            'title': 'Post %d' % self.sequence,
+            'body': 'x' * self.rng.randint(200, 4000),
+            'json_metadata': '{"tags": ["steem"]}',
+        }
+        # Replies to existing comments.
+        if self.comments and self.rng.random() < 0.5:
+            op['parent_author'], op['parent_permlink'] = self.rng.choice(self.comments)
+        if self.rng.random() < self.viral_fraction:
+            self.viral_posts.append([author, permlink, self.viral_votes])
+        return op
+
+    def vote_op(self, author, permlink):
+        return {'voter': self.random_voter(), 'author': author, 'permlink': permlink,
+                'weight': self.rng.choice([10000, 5000, 2500])}
+
+    def block(self, num, timestamp):
+        ops = []
+        for _ in range(self.comments_per_block):
+            op = self.comment_op()
+            self.rpc.add_comment(op, timestamp)
+            self.comments.append((op['author'], op['permlink']))
+            ops.append(['comment', op])
+        for _ in range(self.votes_per_block):
+            if self.viral_posts and self.rng.random() < 0.5:
+                post = self.rng.choice(self.viral_posts)
+                post[2] -= 1
+                if post[2] <= 0:
+                    self.viral_posts.remove(post)
+                author, permlink = post[0], post[1]
+            else:
+                author, permlink = self.rng.choice(self.comments[-5000:])
+            ops.append(['vote', self.vote_op(author, permlink)])
+        ops.extend(self.rpc.take_broadcast_ops())
+        for op_name, op in ops:
+            if op_name == 'vote':
+                self.rpc.add_vote(op, timestamp)
+        self.rpc.head_block_number = num
+        return {
+            'timestamp': format_time(timestamp),
+            'transactions': [{'operations': [op]} for op in ops],
+        }
+
+class StageTimer(object):
+    """Records the latency of each stage."""
+    def __init__(self):
+        # {stage: [seconds, ...], ...}
+        self.samples = {}
+
+    def record(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def get_stats(self):
+        stats = {}
+        for stage, samples in self.samples.items():
+            samples = sorted(samples)
+            def percentile(p):
+                return samples[min(int(len(samples) * p / 100), len(samples) - 1)]
+            stats[stage] = {
+                'count': len(samples),
+                'total': sum(samples),
+                'p50': percentile(50),
+                'p90': percentile(90),
+                'p99': percentile(99),
+                'max': samples[-1],
+            }
+        return stats
+
+def make_voter(args, path):
+    config = Config(no_saving=True)
+    config.set('voter_account_name', BENCHMARK_ACCOUNT)
+    config.set('vote_key', BENCHMARK_WIF)
+    config.set('database_path', os.path.join(path, 'benchmark.db'))
+    authors = ['author%d' % i for i in range(args.authors)]
+    delegates = ['delegate%d' % i for i in range(args.delegates)]
+    # The monitor requires authors in the config options.
+    config.set('authors', authors)
+    config.set_authors([Author(name, vote_replies=i % 2 == 0, priority=Priority.high)
+            for i, name in enumerate(authors)], save=False)
+    config.set_delegates([Delegate(name) for name in delegates], save=False)
+    config.set('blacklist_authors', ['user%d' % i for i in range(100)])
+    return Voter(config), authors, delegates
+
+def run(args):
+    path = tempfile.mkdtemp(prefix='steemvote-benchmark-')
+    voter, authors, delegates = make_voter(args, path)
+    rpc = FakeRPC()
+    voter.steem = FakeSteem(rpc)
+    # Votes are broadcast to the fake node as fast as they are signed.
+    voter.dispatcher.min_interval = 0
+    voter.dispatcher.start()
+    monitor = Monitor(voter)
+    monitor.follow_votes_immediately = True
+
+    chain = SyntheticChain(rpc, ['user%d' % i for i in range(args.users)], authors, delegates,
+            args.comments_per_block, args.votes_per_block, args.viral_fraction, args.viral_votes, args.seed)
+    timer = StageTimer()
+    total_ops = 0
+    # The last block is now, so that comments become old enough to vote on.
+    start_time = int(time.time()) - args.blocks * STEEMIT_BLOCK_INTERVAL
+
+    started = time.time()
+    try:
+        for num in range(1, args.blocks + 1):
+            block = chain.block(num, start_time + num * STEEMIT_BLOCK_INTERVAL)
+            block_started = time.time()
+            voter.update()
+
+            monitor.block_time = start_time + num * STEEMIT_BLOCK_INTERVAL
+            for tx in block['transactions']:
+                for op_name, op in tx['operations']:
+                    if not monitor.has_handler(op_name):
+                        continue
+                    op_started = time.time()
+                    monitor.op_handlers[op_name](op)
+                    timer.record('handle_op', time.time() - op_started)
+                    total_ops += 1
+
+            stage_started = time.time()
+            monitor.flush_hydration_queue()
+            timer.record('hydrate', time.time() - stage_started)
+
+            stage_started = time.time()
+            voter.vote_for_comments()
+            timer.record('vote_for_comments', time.time() - stage_started)
+            timer.record('block', time.time() - block_started)
+
+        stage_started = time.time()
+        voter.db.flush()
+        timer.record('db_flush', time.time() - stage_started)
+        elapsed = time.time() - started
+    finally:
+        voter.close()
+        shutil.rmtree(path, ignore_errors=True)
+
+    return {
+        'parameters': vars(args),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'elapsed': elapsed,
+        'ops': total_ops,
+        'ops_per_second': total_ops / elapsed,
+        'blocks_per_second': args.blocks / elapsed,
+        'tracked_comments': len(voter.db.tracked_comments),
+        # Votes that were broadcast but not seen in a block before the run ended.
+        'unconfirmed_votes': len(voter.unconfirmed_votes),
+        'rpc_calls': rpc.calls,
+        'dispatch': voter.dispatcher.get_stats(),
+        'stages': timer.get_stats(),
+        # ru_maxrss is in KiB on Linux.
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark steemvoter on a synthetic chain.')
+    parser.add_argument('-b', '--blocks', type=int, default=1000, help='Number of blocks (Default: 1000)')
+    parser.add_argument('--comments-per-block', type=int, default=20, help='Comment operations per block (Default: 20)')
+    parser.add_argument('--votes-per-block', type=int, default=200, help='Vote operations per block (Default: 200)')
+    parser.add_argument('--authors', type=int, default=10000, help='Number of configured authors (Default: 10000)')
+    parser.add_argument('--delegates', type=int, default=100, help='Number of configured delegates (Default: 100)')
+    parser.add_argument('--users', type=int, default=50000, help='Number of other accounts on the chain (Default: 50000)')
+    parser.add_argument('--viral-fraction', type=float, default=0.01,
+            help='Fraction of posts that go viral (Default: 0.01)')
+    parser.add_argument('--viral-votes', type=int, default=3000,
+            help='Number of votes that a viral post receives (Default: 3000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (Default: 0)')
+    parser.add_argument('-o', '--output', help='File to write the results to (Default: stdout)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log steemvoter debug messages')
+    args = parser.parse_args()
+
+    level = logging.DEBUG if args.verbose else logging.WARNING
+    # Some steemvote loggers set their own levels, so messages are also filtered by the handler.
+    handler = logging.StreamHandler()
+    handler.setLevel(level)
+    logging.basicConfig(level=level, handlers=[handler])
+    results = json.dumps(run(args), indent=4, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results)
+    else:
+        print(results)
+
+if __name__ == '__main__':
+    main()
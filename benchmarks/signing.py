@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Benchmark the transaction signer backends.
+
+Reports the number of vote transactions that each available backend
+signs per second, in the calling thread and in a process pool.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from steemvote.signing import SigningService, backends
+from steemvote.transactions import DEFAULT_EXPIRATION
+
+# Throwaway key used only for benchmarking.
+BENCHMARK_WIF = '5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3'
+BENCHMARK_PROPS = {
+    'head_block_number': 1,
+    'head_block_id': '0000000100000000000000000000000000000000',
+}
+
+def benchmark(service, count):
+    """Get the number of transactions that service signs per second."""
+    votes = [('@steemvote/benchmark-%d' % i, 100.0) for i in range(count)]
+    # Start the worker processes before timing.
+    service.build_vote_transactions('steemvote', [([vote], DEFAULT_EXPIRATION) for vote in votes[:service.processes]],
+            BENCHMARK_PROPS, BENCHMARK_WIF)
+    started = time.time()
+    service.build_vote_transactions('steemvote', [([vote], DEFAULT_EXPIRATION) for vote in votes], BENCHMARK_PROPS, BENCHMARK_WIF)
+    return count / (time.time() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark transaction signing.')
+    parser.add_argument('-n', '--count', type=int, default=200, help='Number of transactions to sign (Default: 200)')
+    parser.add_argument('-p', '--processes', type=int, default=os.cpu_count(),
+            help='Number of processes for the process pool benchmark (Default: CPU count)')
+    args = parser.parse_args()
+
+    for cls in backends:
+        if not cls.is_available():
+            print('%s: not available' % cls.name)
+            continue
+        for processes in [0, args.processes]:
+            service = SigningService(cls.name, processes)
+            try:
+                rate = benchmark(service, args.count)
+            finally:
+                service.shutdown()
+            where = '%d processes' % processes if processes else 'in thread'
+            print('%s (%s): %.1f signatures/second' % (cls.name, where, rate))
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,10 @@ setup(
         'pyyaml',
         'steem-piston',
     ],
+    extras_require = {
+        # Vectorized evaluation of tracked comments.
+        'numpy': ['numpy'],
+    },
     packages = find_packages(),
     author = 'Tyler Willis',
     author_email = 'kefkius@mail.com',
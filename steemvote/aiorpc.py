@@ -0,0 +1,195 @@
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import ssl
+import struct
+from urllib.parse import urlparse
+
+from grapheneapi.graphenewsrpc import RPCError
+
+# Websocket opcodes.
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+class WebsocketError(Exception):
+    """Exception raised when a websocket connection fails."""
+    pass
+
+class AsyncSteemRPC(object):
+    """Non-blocking JSON-RPC client for a Steem node's websocket.
+
+    Each request is tagged with an id, so any number of requests can be
+    in flight on the connection at once. Responses are routed back to
+    their callers by a reader task.
+    """
+    def __init__(self, url, user='', password='', apis=None, loop=None):
+        self.url = url
+        self.user = user or ''
+        self.password = password or ''
+        self.apis = apis if apis is not None else ['database', 'network_broadcast']
+        self.loop = loop or asyncio.get_event_loop()
+        self.logger = logging.getLogger(__name__)
+
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        self.write_lock = asyncio.Lock()
+        self.request_ids = itertools.count(1)
+        # {request_id: future, ...}
+        self.pending = {}
+        # {api_name: api_id, ...}
+        self.api_ids = {}
+
+    async def connect(self):
+        """Open the websocket and register APIs."""
+        url = urlparse(self.url)
+        if url.scheme not in ['ws', 'wss']:
+            raise ValueError('A websocket URL is required, not %s' % self.url)
+        secure = url.scheme == 'wss'
+        port = url.port or (443 if secure else 80)
+        self.reader, self.writer = await asyncio.open_connection(url.hostname, port,
+                ssl=ssl.create_default_context() if secure else None)
+        await self.handshake(url.netloc, url.path or '/')
+        self.reader_task = asyncio.ensure_future(self.read_responses())
+
+        await self.call('login', self.user, self.password, api_id=1)
+        for api in self.apis:
+            self.api_ids[api] = await self.call('get_api_by_name', '%s_api' % api, api_id=1)
+
+    async def handshake(self, host, path):
+        """Perform the websocket opening handshake."""
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = ('GET %s HTTP/1.1\r\n'
+                   'Host: %s\r\n'
+                   'Upgrade: websocket\r\n'
+                   'Connection: Upgrade\r\n'
+                   'Sec-WebSocket-Key: %s\r\n'
+                   'Sec-WebSocket-Version: 13\r\n\r\n') % (path, host, key)
+        self.writer.write(request.encode())
+        status = await self.reader.readline()
+        if b' 101 ' not in status:
+            raise WebsocketError('Websocket handshake failed: %s' % status.decode().strip())
+        # Skip the response headers.
+        while (await self.reader.readline()) not in [b'\r\n', b'']:
+            pass
+
+    async def close(self):
+        """Close the connection."""
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.writer:
+            self.writer.close()
+        self.fail_pending(WebsocketError('Connection closed'))
+
+    def fail_pending(self, exc):
+        """Fail all requests that are waiting for a response."""
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+    async def send_frame(self, opcode, payload):
+        """Send a single masked frame."""
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 1 << 16:
+            header.append(0x80 | 126)
+            header.extend(struct.pack('!H', length))
+        else:
+            header.append(0x80 | 127)
+            header.extend(struct.pack('!Q', length))
+        mask = os.urandom(4)
+        # Client frames must be masked.
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        async with self.write_lock:
+            self.writer.write(bytes(header) + mask + masked)
+            await self.writer.drain()
+
+    async def read_frame(self):
+        """Read a single frame.
+
+        Returns:
+            A 3-tuple of (fin, opcode, payload).
+        """
+        first, second = await self.reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', await self.reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await self.reader.readexactly(8))[0]
+        mask = await self.reader.readexactly(4) if second & 0x80 else None
+        payload = await self.reader.readexactly(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return (bool(first & 0x80), first & 0x0F, payload)
+
+    async def read_message(self):
+        """Read a complete text or binary message."""
+        message = b''
+        while True:
+            fin, opcode, payload = await self.read_frame()
+            if opcode == OP_PING:
+                await self.send_frame(OP_PONG, payload)
+                continue
+            elif opcode == OP_PONG:
+                continue
+            elif opcode == OP_CLOSE:
+                raise WebsocketError('Connection closed by node')
+            message += payload
+            if fin:
+                return message
+
+    async def read_responses(self):
+        """Route responses to the callers waiting for them."""
+        try:
+            while True:
+                message = await self.read_message()
+                response = json.loads(message.decode('utf-8'), strict=False)
+                future = self.pending.pop(response.get('id'), None)
+                if not future or future.done():
+                    continue
+                if 'error' in response:
+                    error = response['error']
+                    future.set_exception(RPCError(error.get('detail', error.get('message'))))
+                else:
+                    future.set_result(response['result'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error('Websocket reader stopped: %s' % str(e))
+            self.fail_pending(e)
+
+    async def call(self, method, *args, api=None, api_id=None):
+        """Call method on the node and wait for its result."""
+        if api_id is None:
+            if api is None:
+                api_id = 0
+            elif self.api_ids.get(api):
+                api_id = self.api_ids[api]
+            else:
+                raise ValueError('Unknown API! Verify that you have registered to %s' % api)
+
+        request_id = next(self.request_ids)
+        query = {
+            'method': 'call',
+            'params': [api_id, method, list(args)],
+            'jsonrpc': '2.0',
+            'id': request_id,
+        }
+        future = self.loop.create_future()
+        self.pending[request_id] = future
+        try:
+            await self.send_frame(OP_TEXT, json.dumps(query, ensure_ascii=False).encode('utf-8'))
+        except Exception:
+            self.pending.pop(request_id, None)
+            raise
+        return await future
@@ -0,0 +1,200 @@
+"""Evaluation of many tracked comments at once.
+
+Voter.should_vote() is the reference for every decision made here.
+If NumPy is available, the database keeps the fields that decisions
+depend on in CommentColumns, and large batches of comments are
+evaluated with vectorized operations over those columns instead.
+"""
+import threading
+
+from steemvote.models import Priority
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Minimum number of comments to evaluate with NumPy.
+# Smaller batches are faster to evaluate one comment at a time.
+MIN_VECTORIZED_BATCH = 64
+
+# Initial number of rows in CommentColumns.
+INITIAL_CAPACITY = 1024
+
+# Priorities in the order of their indices.
+PRIORITIES = list(Priority.__members__.values())
+PRIORITY_INDICES = {level: i for i, level in enumerate(PRIORITIES)}
+
+def is_vectorized_available():
+    """Get whether NumPy can be used to evaluate comments."""
+    return numpy is not None
+
+class CommentColumns(object):
+    """The tracked comments' decision fields, kept as NumPy columns.
+
+    Each tracked comment has a row, which is updated when the comment is
+    added, voted on by a watched voter or refreshed, and freed when it
+    stops being tracked.
+
+    Some columns depend on the voting rules (author priorities,
+    blacklists and delegates). They are filled in with the rules of the
+    last evaluation, and every row is filled in again when the rules change.
+    """
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        if numpy is None:
+            raise Exception('NumPy is required for comment columns')
+        self.lock = threading.Lock()
+        # The rules that the rule columns were filled in with.
+        self.rules = None
+        # {identifier: row, ...}
+        self.rows = {}
+        # The comment in each row, or None for free rows.
+        self.comments = [None] * capacity
+        # Rows that are not in use.
+        self.free_rows = list(range(capacity - 1, -1, -1))
+
+        self.timestamp = numpy.zeros(capacity, numpy.float64)
+        self.allows_curation = numpy.zeros(capacity, numpy.bool_)
+        # Rule columns.
+        self.author_blacklisted = numpy.zeros(capacity, numpy.bool_)
+        self.category_blacklisted = numpy.zeros(capacity, numpy.bool_)
+        # Index of the author's priority, or -1 if the author is unknown.
+        self.author_priority = numpy.full(capacity, -1, numpy.int8)
+        # Bit i is set if a delegate with the priority at index i has voted.
+        self.delegate_mask = numpy.zeros(capacity, numpy.uint8)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, identifier):
+        return identifier in self.rows
+
+    def _grow(self):
+        """Double the number of rows."""
+        capacity = len(self.comments)
+        for name in ['timestamp', 'allows_curation', 'author_blacklisted', 'category_blacklisted',
+                'author_priority', 'delegate_mask']:
+            column = getattr(self, name)
+            grown = numpy.empty(capacity * 2, column.dtype)
+            grown[:capacity] = column
+            grown[capacity:] = -1 if name == 'author_priority' else 0
+            setattr(self, name, grown)
+        self.comments.extend([None] * capacity)
+        self.free_rows.extend(range(capacity * 2 - 1, capacity - 1, -1))
+
+    def _fill_rule_columns(self, row, comment):
+        rules = self.rules
+        if rules is None:
+            return
+        author = rules.authors.get(comment.author)
+        self.author_priority[row] = PRIORITY_INDICES[author.priority] if author else -1
+        self.author_blacklisted[row] = comment.author in rules.blacklisted_authors
+        self.category_blacklisted[row] = comment.category in rules.blacklisted_categories
+        mask = 0
+        for delegate in rules.get_voted_delegates(comment):
+            mask |= 1 << PRIORITY_INDICES[delegate.priority]
+        self.delegate_mask[row] = mask
+
+    def put(self, comment):
+        """Add comment, or update its row if it is already present."""
+        with self.lock:
+            row = self.rows.get(comment.identifier)
+            if row is None:
+                if not self.free_rows:
+                    self._grow()
+                row = self.free_rows.pop()
+                self.rows[comment.identifier] = row
+            self.comments[row] = comment
+            self.timestamp[row] = comment.timestamp
+            self.allows_curation[row] = bool(comment.allow_curation_rewards and comment.allow_votes)
+            self._fill_rule_columns(row, comment)
+
+    def remove(self, identifiers):
+        """Free the rows of identifiers."""
+        with self.lock:
+            for identifier in identifiers:
+                row = self.rows.pop(identifier, None)
+                if row is not None:
+                    self.comments[row] = None
+                    self.free_rows.append(row)
+
+    def set_rules(self, rules):
+        """Fill in the rule columns of every row with rules."""
+        with self.lock:
+            if rules is self.rules:
+                return
+            self.rules = rules
+            for row in self.rows.values():
+                self._fill_rule_columns(row, self.comments[row])
+
+    def evaluate(self, identifiers, rules, voting_power, now):
+        """Evaluate the comments with identifiers.
+
+        Returns:
+            A 2-tuple of ([should_vote, ...], [should_track, ...]) with
+            one bool in each list for every identifier, or None if
+            any of identifiers is not present.
+        """
+        self.set_rules(rules)
+        with self.lock:
+            try:
+                rows = numpy.fromiter((self.rows[i] for i in identifiers), numpy.intp, len(identifiers))
+            except KeyError:
+                return None
+            timestamp = self.timestamp[rows]
+            allows_curation = self.allows_curation[rows]
+            author_blacklisted = self.author_blacklisted[rows]
+            category_blacklisted = self.category_blacklisted[rows]
+            author_priority = self.author_priority[rows]
+            delegate_mask = self.delegate_mask[rows]
+
+        # Whether each priority is high enough given our voting power.
+        prioritized = [voting_power >= rules.priority_voting_powers[i] for i in PRIORITIES]
+        # Unknown authors have a priority index of -1, which is the last item.
+        author_prioritized = numpy.array(prioritized + [False], dtype=numpy.bool_)
+        prioritized_mask = sum(1 << i for i, value in enumerate(prioritized) if value)
+
+        age = now - timestamp
+        track = allows_curation & ~author_blacklisted & ~category_blacklisted & ~(age > rules.max_post_age)
+        vote = (track & ~(age < rules.min_post_age)
+                & (author_prioritized[author_priority] | ((delegate_mask & prioritized_mask) != 0)))
+        return (vote.tolist(), track.tolist())
+
+def evaluate_each(voter, comments, now):
+    """Evaluate comments one at a time with voter.should_vote().
+
+    Returns:
+        A 2-tuple of ([should_vote, ...], [should_track, ...]) with
+        one bool in each list for every comment.
+    """
+    results = [voter.should_vote(comment, now) for comment in comments]
+    return ([i.vote for i in results], [i.track for i in results])
+
+def evaluate_vectorized(voter, comments, now):
+    """Evaluate tracked comments with the database's comment columns.
+
+    This makes the same decisions as evaluate_each().
+
+    Returns:
+        The same as evaluate_each(), or None if any of comments
+        is not in the columns.
+    """
+    columns = voter.db.columns
+    if columns is None:
+        return None
+    return columns.evaluate([i.identifier for i in comments], voter.rules, voter.voting_power.get(now), now)
+
+def evaluate_comments(voter, comments, now):
+    """Get whether each of comments should be voted on and stay tracked at now.
+
+    Returns:
+        A 2-tuple of ([should_vote, ...], [should_track, ...]) with
+        one bool in each list for every comment.
+    """
+    comments = list(comments)
+    result = None
+    if len(comments) >= MIN_VECTORIZED_BATCH:
+        result = evaluate_vectorized(voter, comments, now)
+    if result is None:
+        result = evaluate_each(voter, comments, now)
+    return result
@@ -0,0 +1,150 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+# Interval at which blocks are produced.
+STEEMIT_BLOCK_INTERVAL = 3 # 3 seconds.
+
+def get_stream_head(props, mode):
+    """Get the number of the latest block that can be streamed in mode.
+
+    Args:
+        props: The result of get_dynamic_global_properties.
+        mode: "head" or "irreversible".
+    """
+    if mode == 'head':
+        return props['head_block_number']
+    return props['last_irreversible_block_num']
+
+class BlockWindow(object):
+    """Requests for blocks that are in flight, in block order.
+
+    This is the windowing logic shared by BlockFetcher.stream() and
+    AsyncEngine.ingest_blocks(). Requests are made with a function that
+    takes a block number and returns a future for the block.
+    """
+    def __init__(self, start, head, size):
+        # Number of the next block to request.
+        self.next_num = start
+        # Number of the latest block that can be requested.
+        self.head = head
+        # Maximum number of requests in flight.
+        self.size = size
+        # [(block_number, future), ...] in block order.
+        self.pending = deque()
+
+    def __len__(self):
+        return len(self.pending)
+
+    def fill(self, request):
+        """Request blocks up to head until the window is full."""
+        while len(self.pending) < self.size and self.next_num <= self.head:
+            self.pending.append((self.next_num, request(self.next_num)))
+            self.next_num += 1
+
+    def update_head(self, head):
+        """Set the latest block that can be requested.
+
+        Returns:
+            Whether there are new blocks to request.
+        """
+        self.head = head
+        return self.next_num <= head
+
+    def pop(self):
+        """Remove the request for the next block in order.
+
+        Returns:
+            A 2-tuple of (block_number, future).
+        """
+        return self.pending.popleft()
+
+    def retry(self, num, request):
+        """Request block num again, ahead of the other requests."""
+        self.pending.appendleft((num, request(num)))
+
+    def cancel(self):
+        """Cancel the requests in flight."""
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+
+class BlockFetcher(object):
+    """Fetches blocks ahead of the consumer.
+
+    While behind the chain, up to window get_block requests are kept
+    in flight at once. Blocks are always yielded in order, regardless
+    of the order in which requests complete. Once the head block is
+    reached, only the newly produced block is requested at a time.
+
+    If streaming starts behind the head block, the rate at which the
+    missed blocks were caught up on is logged.
+    """
+    def __init__(self, rpc, window=10, mode='irreversible'):
+        if window < 1:
+            raise ValueError('Block fetch window must be at least 1')
+        if mode not in ['head', 'irreversible']:
+            raise ValueError('"mode" has to be "head" or "irreversible"')
+        self.rpc = rpc
+        self.window = window
+        self.mode = mode
+        self.block_interval = STEEMIT_BLOCK_INTERVAL
+        self.logger = logging.getLogger(__name__)
+
+    def get_head_block_number(self):
+        """Get the number of the latest block that can be fetched."""
+        return get_stream_head(self.rpc.get_dynamic_global_properties(), self.mode)
+
+    def log_catch_up(self, num_blocks, elapsed):
+        """Log the throughput of catching up on num_blocks blocks."""
+        rate = num_blocks / elapsed if elapsed else float(num_blocks)
+        self.logger.info('Caught up on %d blocks in %.1f seconds (%.1f blocks/s)' % (num_blocks, elapsed, rate))
+
+    def stream(self, start=None):
+        """Stream blocks in order.
+
+        If start is None, streaming begins at the current head block.
+
+        Yields:
+            2-tuples of (block_number, block).
+        """
+        head = self.get_head_block_number()
+        if start is None:
+            start = head
+        window = BlockWindow(start, head, self.window)
+
+        catching_up = start < head
+        if catching_up:
+            self.logger.info('Catching up from block %d to block %d' % (start, head))
+        catch_up_start_time = time.time()
+
+        executor = ThreadPoolExecutor(max_workers=self.window)
+        request = lambda num: executor.submit(self.rpc.get_block, num)
+        try:
+            while True:
+                # Fill the window with requests for blocks up to head.
+                window.fill(request)
+
+                if not window:
+                    # Wait for the next block if there are no new ones.
+                    if not window.update_head(self.get_head_block_number()):
+                        if catching_up:
+                            catching_up = False
+                            self.log_catch_up(window.next_num - start, time.time() - catch_up_start_time)
+                        time.sleep(self.block_interval)
+                    continue
+
+                num, future = window.pop()
+                block = future.result()
+                # Request the block again if it is not available yet.
+                if block is None:
+                    self.logger.debug('Block %d is not available yet' % num)
+                    time.sleep(self.block_interval)
+                    window.retry(num, request)
+                    continue
+
+                yield (num, block)
+        finally:
+            window.cancel()
+            executor.shutdown(wait=False)
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+import threading
+import time
+
+from steemvote.models import make_identifier
+
+class ContentCache(object):
+    """Bounded cache of get_content() results.
+
+    Entries are evicted in least-recently-used order once there are
+    max_size of them, and expire ttl seconds after they are stored.
+    """
+    def __init__(self, max_size=10000, ttl=300):
+        if max_size < 1:
+            raise ValueError('Content cache size must be at least 1')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # {identifier: (expiration_time, content, votes), ...} in LRU order.
+        # votes is {voter: vote, ...} for the votes seen since content was stored,
+        # or None if there are none.
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, identifier):
+        """Get the cached content for identifier, or None."""
+        with self.lock:
+            entry = self.entries.get(identifier)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[identifier]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(identifier)
+            self.hits += 1
+            expiration, content, votes = entry
+            if votes:
+                # Apply the votes to a copy, since content may be in use.
+                content = dict(content)
+                content['active_votes'] = [i for i in content.get('active_votes', []) if i['voter'] not in votes]
+                content['active_votes'].extend(votes.values())
+                self.entries[identifier] = (expiration, content, None)
+            return content
+
+    def put(self, identifier, content):
+        """Store content for identifier."""
+        with self.lock:
+            self.entries[identifier] = (time.time() + self.ttl, content, None)
+            self.entries.move_to_end(identifier)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, identifier):
+        """Remove the cached content for identifier."""
+        with self.lock:
+            self.entries.pop(identifier, None)
+
+    def on_comment_op(self, op):
+        """Update the cache for a comment operation.
+
+        A comment operation creates or edits a comment, so any content
+        cached for it is stale.
+        """
+        self.invalidate(make_identifier(op['author'], op['permlink']))
+
+    def on_vote_op(self, op):
+        """Update the cache for a vote operation.
+
+        The vote is applied to the active votes of the cached content,
+        so that it stays current without being fetched again. Votes are
+        applied when the content is next read, so that popular comments
+        are not copied for each of their votes.
+        """
+        identifier = make_identifier(op['author'], op['permlink'])
+        with self.lock:
+            entry = self.entries.get(identifier)
+            if entry is None:
+                return
+            expiration, content, votes = entry
+            if votes is None:
+                votes = {}
+                self.entries[identifier] = (expiration, content, votes)
+            # A later vote by the same voter replaces the earlier one.
+            votes.pop(op['voter'], None)
+            votes[op['voter']] = {'voter': op['voter'], 'percent': op['weight']}
+
+    def get_stats(self):
+        """Get cache statistics as a dict."""
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -24,6 +24,32 @@ default_values = (
     ('blacklist_authors', []),
     # Default categories to ignore.
     ('blacklist_categories', ['spam']),
+
+    # Default maximum number of votes to broadcast in one transaction.
+    # The chain only allows an account to vote once every 3 seconds, so
+    # transactions with more than one vote are rejected unless this changes.
+    ('vote_batch_size', 1),
+
+    # Default time before a comment can be voted on to sign the vote for it.
+    ('vote_presign_time', 30), # 30 seconds.
+
+    # Default backend to sign transactions with.
+    ('signing_backend', 'auto'),
+    # Default number of processes to sign transactions in.
+    # 0 means that transactions are signed in the thread that votes.
+    ('signing_processes', 0),
+
+    # Default number of blocks to request at once while catching up.
+    ('block_fetch_window', 10),
+    # Default blocks to follow ("irreversible" or "head").
+    ('block_stream_mode', 'irreversible'),
+    # Default number of RPC connections to open to each node.
+    ('rpc_connections_per_node', 2),
+
+    # Default maximum number of comments to cache the content of.
+    ('content_cache_size', 10000),
+    # Default time that cached comment content is valid for.
+    ('content_cache_ttl', 5 * 60), # 5 minutes.
 )
 
 def get_decimal(data):
@@ -50,6 +76,8 @@ class Config(object):
         self.config_format = 'json'
         self.options = {}
         self.defaults = {k: v for (k, v) in default_values}
+        self.set_authors([], save=False)
+        self.set_delegates([], save=False)
 
     def get(self, key, value=None):
         """Get a value.
@@ -109,7 +137,7 @@ class Config(object):
                 # if it isn't in the main authors list.
                 if not self.get_author(author.name):
                     author.priority = Priority.low
-                    self.authors.append(author)
+                    self.set_authors(self.authors + [author], save=False)
             self.logger.info('Updated old value "backup_authors" to low-priority authors')
             del self.options['backup_authors']
             updated = True
@@ -190,35 +218,43 @@ class Config(object):
     def load_authors(self):
         """Load authors from config."""
         authors = self.get('authors', [])
-        self.authors = [Author.from_config(i) for i in authors]
+        self.set_authors([Author.from_config(i) for i in authors], save=False)
 
     def load_delegates(self):
         """Load delegates from config."""
         delegates = self.get('delegates', [])
-        self.delegates = [Delegate.from_config(i) for i in delegates]
+        self.set_delegates([Delegate.from_config(i) for i in delegates], save=False)
 
     def get_author(self, name):
         """Get an author by name."""
-        for author in self.authors:
-            if author.name == name:
-                return author
+        return self.authors_by_name.get(name)
 
     def get_delegate(self, name):
         """Get a delegate by name."""
-        for delegate in self.delegates:
-            if delegate.name == name:
-                return delegate
+        return self.delegates_by_name.get(name)
+
+    def set_authors(self, authors, save=True):
+        """Set authors and save.
 
-    def set_authors(self, authors):
-        """Set authors and save."""
+        Authors are also indexed by name. The index is replaced rather than
+        modified, so readers never see it partly built.
+        """
         if not all(isinstance(i, Author) for i in authors):
             raise TypeError('A list of authors is required')
+        self.authors_by_name = {i.name: i for i in authors}
         self.authors = authors
-        self.save()
+        if save:
+            self.save()
+
+    def set_delegates(self, delegates, save=True):
+        """Set delegates and save.
 
-    def set_delegates(self, delegates):
-        """Set delegates and save."""
+        Delegates are also indexed by name. The index is replaced rather than
+        modified, so readers never see it partly built.
+        """
         if not all(isinstance(i, Delegate) for i in delegates):
             raise TypeError('A list of delegates is required')
+        self.delegates_by_name = {i.name: i for i in delegates}
         self.delegates = delegates
-        self.save()
+        if save:
+            self.save()
@@ -1,23 +1,61 @@
+import enum
+import json
 import logging
 import os
+import sys
 import threading
+import time
+import traceback
 
 import peewee
 
-from steemvote.models import Comment
+from steemvote.batch import CommentColumns, is_vectorized_available
+from steemvote.migrations import get_pending_migrations, parse_version
+from steemvote.models import CommentSnapshot, hydrate_comments
+from steemvote.scheduler import ExpiryWheel
 
-database = peewee.SqliteDatabase(None)
+# SQLite settings for every connection.
+# In WAL mode, readers do not block the writer and the writer does not block readers.
+DB_PRAGMAS = (
+    ('journal_mode', 'wal'),
+    # WAL mode is safe from corruption with fewer fsyncs.
+    ('synchronous', 'normal'),
+    # Cache size in KiB (when negative).
+    ('cache_size', -16 * 1024),
+    ('temp_store', 'memory'),
+)
+
+database = peewee.SqliteDatabase(None, pragmas=DB_PRAGMAS)
+
+# Maximum number of identifiers to use in one query.
+# SQLite limits the number of variables in a statement to 999.
+MAX_QUERY_IDENTIFIERS = 500
+# Interval between commits of pending writes.
+COMMIT_INTERVAL = 1 # 1 second.
+
+def chunks(items, size=MAX_QUERY_IDENTIFIERS):
+    """Split items into lists of at most size items."""
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
 class DBVersionError(Exception):
     """Exception raised when an incompatible database version is encountered."""
     pass
 
+class CommentStatus(enum.Enum):
+    """Constants for the status of stored comments."""
+    tracked = 'tracked'
+    voted = 'voted'
+
 class TrackedComment(object):
     """A comment with additional metadata."""
+    __slots__ = ('comment', 'reason_type', 'reason_value')
+
     def __init__(self, comment, reason_type, reason_value):
         self.comment = comment
-        self.reason_type = reason_type
-        self.reason_value = reason_value
+        # Reasons are shared by many comments, so they are interned.
+        self.reason_type = sys.intern(reason_type)
+        self.reason_value = sys.intern(reason_value)
 
 class BaseDBModel(peewee.Model):
     class Meta:
@@ -34,15 +72,151 @@ class DBComment(BaseDBModel):
     reason_type = peewee.CharField()
     # Value for why this comment is voted on.
     reason_value = peewee.CharField()
-    # Whether this comment is being tracked.
-    tracked = peewee.BooleanField()
-    # Whether this comment has been voted on.
-    voted = peewee.BooleanField()
+    # Creation time of this comment.
+    created = peewee.IntegerField(null=True)
+    # CommentStatus value. This is the comment's state.
+    status = peewee.CharField(default=CommentStatus.tracked.value)
+    # JSON-encoded CommentSnapshot.
+    snapshot = peewee.TextField(null=True)
+
+    class Meta:
+        indexes = (
+            # Tracked comments are loaded by their status, and
+            # recently voted comments by their status and creation time.
+            (('status', 'created'), False),
+        )
+
+class DBWriter(threading.Thread):
+    """Writes to the database from one thread.
+
+    Writes are queued and committed together once every COMMIT_INTERVAL
+    seconds, with one set-based statement per kind of write, so that one
+    transaction covers many changes.
+    """
+    def __init__(self, interval=COMMIT_INTERVAL):
+        super(DBWriter, self).__init__()
+        self.daemon = True
+        self.logger = logging.getLogger(__name__)
+        self.interval = interval
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.stopping = False
+
+        # {identifier: [reason_type, reason_value, created, snapshot], ...}
+        self.inserts = {}
+        # {identifier: snapshot, ...}
+        self.snapshots = {}
+        # Identifiers of comments that have been voted on.
+        self.voted = set()
+        # Identifiers of comments that should no longer be tracked.
+        self.deletes = set()
+        # {key: value, ...}
+        self.config_values = {}
+
+    def insert_comment(self, identifier, reason_type, reason_value, created, snapshot):
+        """Queue a tracked comment to be inserted."""
+        with self.condition:
+            self.deletes.discard(identifier)
+            self.inserts[identifier] = [reason_type, reason_value, created, snapshot]
+
+    def update_snapshot(self, identifier, snapshot):
+        """Queue the snapshot of a comment to be updated."""
+        with self.condition:
+            if identifier in self.inserts:
+                self.inserts[identifier][3] = snapshot
+            else:
+                self.snapshots[identifier] = snapshot
+
+    def mark_voted(self, identifiers):
+        """Queue comments to be marked as voted on."""
+        with self.condition:
+            self.voted.update(identifiers)
+
+    def delete_tracked(self, identifiers):
+        """Queue tracked comments that have not been voted on to be deleted."""
+        with self.condition:
+            self.deletes.update(identifiers)
+
+    def set_config_value(self, key, value):
+        """Queue a config value to be stored."""
+        with self.condition:
+            self.config_values[key] = value
+
+    def get_config_value(self, key):
+        """Get a config value that has not been stored yet, or None."""
+        with self.condition:
+            return self.config_values.get(key)
+
+    def is_pending(self, identifier):
+        """Get whether there are pending writes for identifier."""
+        with self.condition:
+            return any(identifier in i for i in [self.inserts, self.snapshots, self.voted, self.deletes])
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.stopping:
+                    self.condition.wait(self.interval)
+                stopping = self.stopping
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(str(e))
+                self.logger.error(''.join(traceback.format_tb(sys.exc_info()[2])))
+            if stopping:
+                break
+
+    def stop(self):
+        """Commit pending writes and stop."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.is_alive():
+            self.join()
+        else:
+            self.flush()
+
+    def flush(self):
+        """Commit the pending writes in one transaction."""
+        with self.flush_lock:
+            with self.condition:
+                inserts, self.inserts = self.inserts, {}
+                snapshots, self.snapshots = self.snapshots, {}
+                voted, self.voted = self.voted, set()
+                deletes, self.deletes = self.deletes, set()
+                config_values, self.config_values = self.config_values, {}
+            if not any([inserts, snapshots, voted, deletes, config_values]):
+                return
+
+            with database.atomic():
+                rows = [{'identifier': identifier, 'reason_type': reason_type, 'reason_value': reason_value,
+                        'created': created, 'status': CommentStatus.tracked.value, 'snapshot': snapshot}
+                        for identifier, (reason_type, reason_value, created, snapshot) in inserts.items()]
+                # Each row has 6 variables.
+                for chunk in chunks(rows, MAX_QUERY_IDENTIFIERS // 6):
+                    DBComment.insert_many(chunk).on_conflict('IGNORE').execute()
+                for identifier, snapshot in snapshots.items():
+                    DBComment.update(snapshot=snapshot).where(DBComment.identifier == identifier).execute()
+                for chunk in chunks(voted):
+                    DBComment.update(status=CommentStatus.voted.value).where(DBComment.identifier << chunk).execute()
+                for chunk in chunks(deletes):
+                    DBComment.delete().where((DBComment.identifier << chunk) &
+                            (DBComment.status == CommentStatus.tracked.value)).execute()
+                for key, value in config_values.items():
+                    updated = DBConfig.update(value=value).where(DBConfig.key == key).execute()
+                    if not updated:
+                        DBConfig.create(key=key, value=value)
+            self.logger.debug('Committed %d inserts, %d votes, %d deletes' % (len(inserts), len(voted), len(deletes)))
 
 class DB(object):
-    """Database for storing data."""
+    """Database for storing data.
+
+    Tracked comments are kept in memory. Changes to them are written to
+    the database by a DBWriter thread.
+    """
     # Current database version.
-    db_version = '0.1.0'
+    # Older databases are moved to this version by the migrations in steemvote.migrations.
+    db_version = '0.4.0'
 
     def __init__(self, config):
         self.logger = logging.getLogger(__name__)
@@ -54,22 +228,49 @@ class DB(object):
         self.db.connect()
 
         DBConfig.create_table(fail_silently=True)
-        DBComment.create_table(fail_silently=True)
+        # The indexes of the current table need columns that older tables lack,
+        # so the table is only created if it does not exist. Older tables are migrated.
+        if not DBComment.table_exists():
+            DBComment.create_table()
         self.check_version()
 
         self.lock = threading.RLock()
         # {identifier: TrackedComment, ...}
         self.tracked_comments = {}
+        # Tracked comment identifiers by comment creation time.
+        self.expiry_wheel = ExpiryWheel()
+        # Decision fields of tracked comments, if NumPy is available.
+        self.columns = CommentColumns() if is_vectorized_available() else None
+        # Stored comments that are no longer tracked, such as comments that
+        # have been voted on, by creation time. These are not tracked again.
+        # Only comments younger than max_post_age are kept, since older
+        # comments cannot be tracked anyway.
+        self.untracked_comments = ExpiryWheel()
+        cutoff = time.time() - config.get_seconds('max_post_age')
+        query = DBComment.select(DBComment.identifier, DBComment.created).where(
+                (DBComment.status == CommentStatus.voted.value) & (DBComment.created >= cutoff))
+        for c in query:
+            self.untracked_comments.add(c.identifier, c.created)
+
+        self.writer = DBWriter()
+        self.writer.start()
 
     def check_version(self):
         """Check the database version and update it if possible."""
         version = self.get_version()
-        if version < '0.1.0':
+        if parse_version(version) < (0, 1, 0):
             raise DBVersionError('Invalid database version (%s)' % version)
         # Handle future db versions.
-        elif version > self.db_version:
+        elif parse_version(version) > parse_version(self.db_version):
             raise DBVersionError('Stored database version (%s) is greater than current version (%s)' % (version, self.db_version))
 
+        for target, migration in get_pending_migrations(version):
+            self.logger.info('Updating database from version %s to %s' % (version, target))
+            with self.db.atomic():
+                migration(self.db)
+                self.set_version(target)
+            version = target
+
     def get_version(self):
         """Get the stored database version."""
         query = DBConfig.select().where(DBConfig.key == 'db_version')
@@ -80,31 +281,97 @@ class DB(object):
             version = self.db_version
         return version
 
-    def set_version(self):
-        """Store the current database version."""
-        DBConfig.create(key='db_version', value=self.db_version)
+    def set_version(self, version=None):
+        """Store the database version.
+
+        If version is None, the current version is stored.
+        """
+        if version is None:
+            version = self.db_version
+        updated = DBConfig.update(value=version).where(DBConfig.key == 'db_version').execute()
+        if not updated:
+            DBConfig.create(key='db_version', value=version)
+
+    def get_last_block(self):
+        """Get the number of the last block that was processed.
 
-    def load(self, steem):
-        """Load state."""
+        Returns None if no block has been processed.
+        """
+        value = self.writer.get_config_value('last_block')
+        if value is not None:
+            return int(value)
+        query = DBConfig.select().where(DBConfig.key == 'last_block')
+        if query.exists():
+            return int(query.get().value)
+        return None
+
+    def set_last_block(self, block_num):
+        """Store the number of the last processed block."""
+        self.writer.set_config_value('last_block', str(block_num))
+
+    def load(self, steem, cache=None):
+        """Load state.
+
+        Tracked comments are loaded from their stored snapshots. Comments
+        stored without snapshots are fetched, and if cache is given,
+        their content is taken from it when possible.
+
+        Loaded snapshots are marked as stale, since votes may have been
+        missed while steemvoter was not running.
+        """
         # Load the comments to be voted on.
-        for c in DBComment.select().where((DBComment.tracked == True) & (DBComment.voted == False)):
-            comment = Comment(steem, c.identifier)
-            self.tracked_comments[comment.identifier] = TrackedComment(comment, c.reason_type, c.reason_value)
+        rows = list(DBComment.select().where(DBComment.status == CommentStatus.tracked.value))
+        snapshots = {}
+        for c in rows:
+            if c.snapshot:
+                snapshots[c.identifier] = CommentSnapshot.from_dict(json.loads(c.snapshot))
+
+        missing = [c.identifier for c in rows if c.identifier not in snapshots]
+        if missing:
+            for identifier, comment in hydrate_comments(steem, missing, cache).items():
+                snapshot = CommentSnapshot.from_comment(comment)
+                snapshots[identifier] = snapshot
+                self.writer.update_snapshot(identifier, json.dumps(snapshot.to_dict()))
+
+        with self.lock:
+            for c in rows:
+                snapshot = snapshots.get(c.identifier)
+                if not snapshot:
+                    self.logger.debug('Could not load %s' % c.identifier)
+                    continue
+                snapshot.stale = True
+                self.tracked_comments[c.identifier] = TrackedComment(snapshot, c.reason_type, c.reason_value)
+                self.expiry_wheel.add(c.identifier, snapshot.timestamp)
+                if self.columns is not None:
+                    self.columns.put(snapshot)
+
+    def flush(self):
+        """Commit pending writes now."""
+        self.writer.flush()
 
     def close(self):
+        self.writer.stop()
         self.db.close()
 
     def add_comment(self, comment, reason_type, reason_value):
         """Add a comment to be voted on later."""
         with self.lock:
             # Check if the post is already in the database.
-            if DBComment.select().where(DBComment.identifier == comment.identifier).exists():
+            # Rows that are written at the same time are ignored by the writer.
+            identifier = comment.identifier
+            if identifier in self.tracked_comments or identifier in self.untracked_comments:
+                return False
+            if self.writer.is_pending(identifier):
                 return False
 
             # Add the comment.
-            DBComment.create(identifier=comment.identifier, reason_type=reason_type, reason_value=reason_value,
-                    tracked=True, voted=False)
-            self.tracked_comments[comment.identifier] = TrackedComment(comment, reason_type, reason_value)
+            snapshot = CommentSnapshot.from_comment(comment)
+            self.writer.insert_comment(identifier, reason_type, reason_value, comment.timestamp,
+                    json.dumps(snapshot.to_dict()))
+            self.tracked_comments[identifier] = TrackedComment(snapshot, reason_type, reason_value)
+            self.expiry_wheel.add(identifier, comment.timestamp)
+            if self.columns is not None:
+                self.columns.put(snapshot)
             return True
 
     def add_comment_with_author(self, comment):
@@ -112,23 +379,23 @@ class DB(object):
         added = self.add_comment(comment, 'author', comment.author)
         if added:
             self.logger.info('Added %s by %s' % (comment.identifier, comment.author))
+        return added
 
     def add_comment_with_delegate(self, comment, delegate_name):
         """Add a comment to be voted on later due to a delegate voter."""
         added = self.add_comment(comment, 'delegate', delegate_name)
         if added:
             self.logger.info('Added %s voted for by %s' % (comment.identifier, delegate_name))
+        return added
 
     def update_voted_comments(self, comments):
         """Update comments that have been voted on."""
+        identifiers = [i.identifier for i in comments]
         with self.lock:
+            self.writer.mark_voted(identifiers)
             for comment in comments:
-                c = DBComment.select().where(DBComment.identifier == comment.identifier).get()
-                c.tracked = False
-                c.voted = True
-                c.save()
-
-            self.remove_tracked_comments([i.identifier for i in comments])
+                self.untracked_comments.add(comment.identifier, comment.timestamp)
+            self.forget_comments(identifiers)
 
     def get_tracked_comments(self, with_metadata=True):
         """Get the comments that are being tracked.
@@ -142,13 +409,73 @@ class DB(object):
                 comments = [i.comment for i in comments]
         return comments
 
+    def record_vote(self, identifier, voter_name):
+        """Record a vote by voter_name on a tracked comment."""
+        with self.lock:
+            tracked_comment = self.tracked_comments.get(identifier)
+            if tracked_comment:
+                tracked_comment.comment.add_voter(voter_name)
+                self.update_snapshot(tracked_comment.comment)
+                if self.columns is not None:
+                    self.columns.put(tracked_comment.comment)
+
+    def update_snapshot(self, snapshot):
+        """Store the current state of a tracked comment's snapshot."""
+        self.writer.update_snapshot(snapshot.identifier, json.dumps(snapshot.to_dict()))
+
+    def refresh_comments(self, steem, identifiers, voter_names, cache=None):
+        """Replace the snapshots of tracked comments with ones made from fresh content.
+
+        Only the votes by voter_names are kept in the new snapshots.
+        """
+        comments = hydrate_comments(steem, identifiers, cache)
+        with self.lock:
+            for identifier, comment in comments.items():
+                tracked_comment = self.tracked_comments.get(identifier)
+                if not tracked_comment:
+                    continue
+                comment.index_voters(voter_names)
+                tracked_comment.comment = CommentSnapshot.from_comment(comment)
+                self.update_snapshot(tracked_comment.comment)
+                if self.columns is not None:
+                    self.columns.put(tracked_comment.comment)
+
+    def get_tracked_comment(self, identifier):
+        """Get the TrackedComment for identifier, or None."""
+        with self.lock:
+            return self.tracked_comments.get(identifier)
+
+    def is_tracked(self, identifier):
+        """Get whether the comment with identifier is being tracked."""
+        with self.lock:
+            return identifier in self.tracked_comments
+
     def remove_tracked_comments(self, identifiers):
         """Stop tracking comments with the given identifiers."""
+        identifiers = list(identifiers)
+        with self.lock:
+            self.writer.delete_tracked(identifiers)
+            self.forget_comments(identifiers)
+
+    def forget_comments(self, identifiers):
+        """Remove comments from memory."""
         with self.lock:
             for identifier in identifiers:
-                c = DBComment.select().where((DBComment.identifier == identifier) & (DBComment.tracked == True) & (DBComment.voted == False))
-                if c.exists():
-                    c.get().delete_instance()
+                self.tracked_comments.pop(identifier, None)
+            self.expiry_wheel.remove(identifiers)
+            if self.columns is not None:
+                self.columns.remove(identifiers)
 
-                if identifier in self.tracked_comments:
-                    del self.tracked_comments[identifier]
+    def expire_comments(self, cutoff):
+        """Stop tracking comments that were created before cutoff.
+
+        Returns:
+            The identifiers of the expired comments.
+        """
+        with self.lock:
+            self.untracked_comments.pop_expired(cutoff)
+            identifiers = self.expiry_wheel.pop_expired(cutoff)
+            if identifiers:
+                self.remove_tracked_comments(identifiers)
+                self.logger.debug('Expired %d comments' % len(identifiers))
+        return identifiers
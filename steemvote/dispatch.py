@@ -0,0 +1,168 @@
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+
+# Minimum number of seconds between votes by one account.
+STEEMIT_MIN_VOTE_INTERVAL_SEC = 3
+
+# Number of threads that broadcast votes.
+DISPATCH_WORKERS = 2
+# Number of times to retry a vote after a transient failure.
+MAX_DISPATCH_RETRIES = 3
+# Delay before the first retry. It doubles with each retry.
+DISPATCH_RETRY_DELAY = 2 # 2 seconds.
+
+class VoteJob(object):
+    """Votes waiting to be broadcast in one transaction."""
+    def __init__(self, votes):
+        # [(comment, weight), ...]
+        self.votes = votes
+        self.queued_time = time.time()
+        self.attempts = 0
+
+class VoteDispatcher(object):
+    """Broadcasts votes from a queue with a pool of worker threads.
+
+    Broadcasts are spaced at least min_interval seconds apart, since the
+    chain rejects votes by one account that are closer together. Workers
+    may wait on slow broadcasts at the same time, so one slow broadcast
+    does not hold up the votes behind it.
+
+    The outcome of each vote is reported to the voter with
+    record_voting_results().
+    """
+    def __init__(self, voter, num_workers=DISPATCH_WORKERS, min_interval=STEEMIT_MIN_VOTE_INTERVAL_SEC):
+        if num_workers < 1:
+            raise ValueError('Vote dispatcher must have at least 1 worker')
+        self.logger = logging.getLogger(__name__)
+        self.voter = voter
+        self.num_workers = num_workers
+        self.min_interval = min_interval
+        self.queue = queue.Queue()
+        self.workers = []
+        self.stopping = threading.Event()
+
+        self.lock = threading.Lock()
+        # Identifiers of comments that are queued or being voted on.
+        self.pending = set()
+        # Earliest time that the next broadcast can be made.
+        self.next_broadcast_time = 0
+
+        # Stats.
+        self.in_flight = 0
+        self.dispatched = 0
+        self.failed = 0
+        self.retries = 0
+        self.total_latency = 0.0
+        self.last_latency = None
+
+    def start(self):
+        """Start the worker threads."""
+        self.stopping.clear()
+        for _ in range(self.num_workers):
+            worker = threading.Thread(target=self.run_worker)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=None):
+        """Stop the worker threads once they finish their current votes."""
+        self.stopping.set()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def dispatch(self, votes):
+        """Queue votes to be broadcast.
+
+        Comments that are already queued are skipped.
+
+        Args:
+            votes: A list of (comment, weight) 2-tuples.
+        """
+        with self.lock:
+            votes = [i for i in votes if i[0].identifier not in self.pending]
+            self.pending.update(i[0].identifier for i in votes)
+        for batch in self.voter.get_vote_batches(votes):
+            self.queue.put(VoteJob(batch))
+
+    def is_pending(self, identifier):
+        """Get whether a vote for identifier is queued or being broadcast."""
+        with self.lock:
+            return identifier in self.pending
+
+    def wait_for_broadcast_slot(self):
+        """Wait until a broadcast can be made without breaking the minimum vote interval."""
+        with self.lock:
+            now = time.time()
+            broadcast_time = max(now, self.next_broadcast_time)
+            self.next_broadcast_time = broadcast_time + self.min_interval
+        if broadcast_time > now:
+            self.stopping.wait(broadcast_time - now)
+
+    def run_worker(self):
+        while not self.stopping.is_set():
+            job = self.queue.get()
+            if job is None:
+                break
+            with self.lock:
+                self.in_flight += 1
+            try:
+                self.process(job)
+            except Exception as e:
+                self.logger.error(str(e))
+                self.logger.error(''.join(traceback.format_tb(sys.exc_info()[2])))
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+    def process(self, job):
+        """Broadcast the votes in job and report the outcome."""
+        comments = {comment.identifier: comment for comment, _ in job.votes}
+        votes = [(comment.identifier, weight) for comment, weight in job.votes]
+        voted, failed = [], list(comments.keys())
+        try:
+            while not self.stopping.is_set():
+                try:
+                    # Transactions that rejected votes are split into also wait for a slot.
+                    voted, failed = self.voter.vote_batch(votes, self.wait_for_broadcast_slot)
+                    break
+                except Exception as e:
+                    # Failures other than rejected votes are assumed to be transient.
+                    job.attempts += 1
+                    if job.attempts > MAX_DISPATCH_RETRIES:
+                        self.logger.error('Giving up on votes for %s: %s' % (', '.join(comments.keys()), str(e)))
+                        break
+                    delay = DISPATCH_RETRY_DELAY * 2 ** (job.attempts - 1)
+                    self.logger.debug('Retrying votes in %d seconds: %s' % (delay, str(e)))
+                    with self.lock:
+                        self.retries += 1
+                    self.stopping.wait(delay)
+        finally:
+            self.voter.record_voting_results([comments[i] for i in voted], [],
+                    [comments[i] for i in failed])
+            with self.lock:
+                self.pending.difference_update(comments.keys())
+                self.dispatched += len(voted)
+                self.failed += len(failed)
+                if voted:
+                    self.last_latency = time.time() - job.queued_time
+                    self.total_latency += self.last_latency * len(voted)
+
+    def get_stats(self):
+        """Get dispatch statistics as a dict."""
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'in_flight': self.in_flight,
+                'dispatched': self.dispatched,
+                'failed': self.failed,
+                'retries': self.retries,
+                'last_latency': self.last_latency,
+                'average_latency': self.total_latency / self.dispatched if self.dispatched else None,
+            }
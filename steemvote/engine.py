@@ -0,0 +1,265 @@
+import asyncio
+from collections import deque
+import logging
+import sys
+import traceback
+
+from grapheneapi.graphenewsrpc import RPCError
+
+from steemvote.aiorpc import AsyncSteemRPC
+from steemvote.blocks import STEEMIT_BLOCK_INTERVAL, BlockWindow, get_stream_head
+from steemvote.dispatch import STEEMIT_MIN_VOTE_INTERVAL_SEC
+from steemvote.models import Comment, make_identifier, parse_time
+from steemvote.monitor import Monitor
+
+# Maximum number of comments to fetch the content of at once.
+MAX_HYDRATION_REQUESTS = 32
+
+class AsyncEngine(object):
+    """Runs steemvoter on an asyncio event loop.
+
+    Block ingestion, comment hydration, voting power updates and vote
+    broadcasts all run as coroutines that share one non-blocking RPC
+    connection, so many requests can be in flight without a thread for
+    each of them.
+
+    The decisions themselves are made by the same Voter and Monitor
+    methods that the threaded runtime uses.
+    """
+    def __init__(self, voter, vote_interval, loop=None):
+        self.logger = logging.getLogger(__name__)
+        self.voter = voter
+        self.monitor = Monitor(voter)
+        # vote_forever() wakes up as soon as a delegate's vote makes a comment due.
+        self.monitor.follow_votes_immediately = False
+        self.vote_interval = vote_interval
+        self.loop = loop or asyncio.get_event_loop()
+        self.rpc = None
+        self.hydration_semaphore = asyncio.Semaphore(MAX_HYDRATION_REQUESTS)
+        # Set when a comment is scheduled to be evaluated sooner.
+        self.schedule_changed = None
+        # Earliest time that the next vote can be broadcast.
+        self.next_broadcast_time = 0
+        self.tasks = []
+
+    @property
+    def db(self):
+        return self.voter.db
+
+    def run(self):
+        """Run until interrupted."""
+        try:
+            self.loop.run_until_complete(self.main())
+        except KeyboardInterrupt:
+            self.logger.debug('Received keyboard interrupt. Quitting.')
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            self.loop.run_until_complete(self.shutdown())
+
+    async def main(self):
+        # The regular connection is used to load state and build comments.
+        # Loading the database blocks, so it is kept off of the event loop.
+        # Votes are broadcast by vote_forever() instead of the voter's dispatcher.
+        await self.loop.run_in_executor(None, self.voter.connect_to_steem, False)
+        self.rpc = AsyncSteemRPC(self.voter.steem.rpc.url, self.voter.rpc_user,
+                self.voter.rpc_pass, loop=self.loop)
+        await self.rpc.connect()
+        await self.update_voter()
+
+        self.schedule_changed = asyncio.Event()
+        self.voter.scheduler.add_listener(lambda: self.loop.call_soon_threadsafe(self.schedule_changed.set))
+
+        self.tasks = [asyncio.ensure_future(coro) for coro in [
+            self.ingest_blocks(),
+            self.update_voter_forever(),
+            self.vote_forever(),
+        ]]
+        await asyncio.gather(*self.tasks)
+
+    async def shutdown(self):
+        self.monitor.save_cursor(force=True)
+        if self.rpc:
+            await self.rpc.close()
+
+    def log_exception(self, e):
+        self.logger.error(str(e))
+        self.logger.error(''.join(traceback.format_tb(sys.exc_info()[2])))
+
+    async def get_head_block_number(self):
+        props = await self.rpc.call('get_dynamic_global_properties')
+        return get_stream_head(props, self.monitor.block_stream_mode)
+
+    async def ingest_blocks(self):
+        """Fetch blocks in order and hydrate the comments in their operations."""
+        head = await self.get_head_block_number()
+        window = BlockWindow(self.monitor.get_start_block(head), head, self.monitor.block_fetch_window)
+        request = lambda num: asyncio.ensure_future(self.rpc.call('get_block', num))
+        # [(block_number, [hydration_task, ...]), ...] in block order.
+        processing = deque()
+
+        try:
+            while True:
+                window.fill(request)
+
+                if not window:
+                    if not window.update_head(await self.get_head_block_number()):
+                        await asyncio.sleep(STEEMIT_BLOCK_INTERVAL)
+                    continue
+
+                num, future = window.pop()
+                block = await future
+                if block is None:
+                    await asyncio.sleep(STEEMIT_BLOCK_INTERVAL)
+                    window.retry(num, request)
+                    continue
+
+                tasks = []
+                block_time = parse_time(block['timestamp'])
+                for tx in block['transactions']:
+                    for op_name, op in tx['operations']:
+                        task = self.handle_op(op_name, op, block_time)
+                        if task:
+                            tasks.append(task)
+                processing.append((num, tasks))
+
+                # A block is processed once all of its comments are hydrated.
+                while processing and all(task.done() for task in processing[0][1]):
+                    self.monitor.last_block = processing.popleft()[0]
+                self.monitor.save_cursor()
+        finally:
+            window.cancel()
+
+    def handle_op(self, op_name, op, block_time):
+        """Start hydrating the comment in op if it could be tracked.
+
+        block_time is the timestamp of the block that op is in.
+
+        Returns:
+            The hydration task, or None if op was rejected.
+        """
+        cache = self.voter.content_cache
+        if op_name == 'comment':
+            cache.on_comment_op(op)
+            should_track = self.voter.prescreen_comment_op(op)
+        elif op_name == 'vote':
+            cache.on_vote_op(op)
+            if self.voter.is_watched_voter(op['voter']):
+                identifier = make_identifier(op['author'], op['permlink'])
+                self.db.record_vote(identifier, op['voter'])
+                if op['voter'] == self.voter.name:
+                    self.voter.on_own_vote_op(op, block_time)
+                else:
+                    self.voter.on_watched_vote(identifier)
+            should_track = self.voter.prescreen_vote_op(op)
+        else:
+            return None
+        if not should_track.track or self.db.is_tracked(make_identifier(op['author'], op['permlink'])):
+            return None
+        return asyncio.ensure_future(self.hydrate(op_name, op))
+
+    async def hydrate(self, op_name, op):
+        """Fetch the content of the comment in op and track it if eligible."""
+        identifier = make_identifier(op['author'], op['permlink'])
+        cache = self.voter.content_cache
+        try:
+            content = cache.get(identifier)
+            if content is None:
+                async with self.hydration_semaphore:
+                    content = await self.rpc.call('get_content', op['author'], op['permlink'])
+                # Nonexistent comments have an empty author.
+                if not content or not content.get('author'):
+                    return
+                cache.put(identifier, content)
+            # Copy the content, since Post modifies it.
+            comment = Comment(self.voter.steem, dict(content))
+            self.monitor.track_comment(op_name, op, comment)
+        except ValueError as e:
+            self.logger.debug('Invalid comment. Skipping')
+        except Exception as e:
+            self.log_exception(e)
+
+    async def update_voter(self):
+        """Update voter stats."""
+        accounts = await self.rpc.call('get_accounts', [self.voter.name])
+        self.voter.update_from_account(accounts[0])
+
+    async def update_voter_forever(self):
+        while True:
+            await asyncio.sleep(self.voter.update_interval)
+            try:
+                await self.update_voter()
+            except Exception as e:
+                self.log_exception(e)
+
+    async def vote(self, votes):
+        """Create and broadcast one transaction that votes for comments."""
+        tx = self.voter.take_presigned_transaction(votes)
+        if tx is None:
+            props = await self.rpc.call('get_dynamic_global_properties')
+            # Signing is CPU-bound, so it is kept off of the event loop.
+            tx = await self.loop.run_in_executor(None, self.voter.signer.build_vote_transaction,
+                    self.voter.name, votes, props, self.voter.wif)
+        # The chain rejects votes by one account that are too close together.
+        delay = self.next_broadcast_time - self.loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.next_broadcast_time = self.loop.time() + STEEMIT_MIN_VOTE_INTERVAL_SEC
+        await self.rpc.call('broadcast_transaction', tx, api='network_broadcast')
+
+    async def vote_batch(self, votes):
+        """Vote for comments with as few transactions as possible.
+
+        The transactions are worked out by Voter.split_vote_batch(),
+        as they are by Voter.vote_batch().
+        """
+        transactions = self.voter.split_vote_batch(votes)
+        votes = next(transactions)
+        while True:
+            try:
+                await self.vote(votes)
+                error = None
+            except RPCError as e:
+                error = e
+            try:
+                votes = transactions.send(error)
+            except StopIteration as e:
+                return e.value
+
+    async def vote_for_comments(self):
+        """Vote on the comments that are ready."""
+        # Stale comments may be fetched, so this is kept off of the event loop.
+        votes, voted_comments, old_identifiers = await self.loop.run_in_executor(None, self.voter.get_comments_to_vote)
+        comments = {comment.identifier: comment for comment, _ in votes}
+        # Comments that have not been voted on yet.
+        remaining = set(comments.keys())
+        failed_identifiers = []
+        try:
+            for batch in self.voter.get_vote_batches([(comment.identifier, weight) for comment, weight in votes]):
+                voted, failed = await self.vote_batch(batch)
+                voted_comments.extend(comments[i] for i in voted)
+                failed_identifiers.extend(failed)
+                remaining.difference_update(i[0] for i in batch)
+        finally:
+            failed_identifiers.extend(remaining)
+            self.voter.record_voting_results(voted_comments, old_identifiers,
+                    [comments[i] for i in failed_identifiers])
+
+    async def vote_forever(self):
+        while True:
+            self.schedule_changed.clear()
+            try:
+                await self.vote_for_comments()
+                # Sign the votes for comments that will be ready soon.
+                await self.loop.run_in_executor(None, self.voter.presign_votes)
+            except Exception as e:
+                self.log_exception(e)
+            # Wait until a comment is due, or for at most vote_interval.
+            timeout = self.vote_interval
+            delay = self.voter.scheduler.time_until_due()
+            if delay is not None:
+                timeout = min(timeout, delay)
+            try:
+                await asyncio.wait_for(self.schedule_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
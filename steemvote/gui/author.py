@@ -16,6 +16,7 @@ class AuthorsModel(QAbstractTableModel):
 
     # Role for sorting
     SortRole = Qt.UserRole + 1
+    authorsChanged = pyqtSignal()
     def __init__(self, config, parent=None):
         super(AuthorsModel, self).__init__(parent)
         self.config = config
@@ -78,6 +79,7 @@ class AuthorsModel(QAbstractTableModel):
     def save(self):
         """Update config and save."""
         self.config.set_authors(self.authors)
+        self.authorsChanged.emit()
 
     def columnCount(self, parent=QModelIndex()):
         return self.TOTAL_FIELDS
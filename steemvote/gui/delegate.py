@@ -15,6 +15,7 @@ class DelegatesModel(QAbstractTableModel):
 
     # Role for sorting
     SortRole = Qt.UserRole + 1
+    delegatesChanged = pyqtSignal()
     def __init__(self, config, parent=None):
         super(DelegatesModel, self).__init__(parent)
         self.config = config
@@ -73,6 +74,7 @@ class DelegatesModel(QAbstractTableModel):
     def save(self):
         """Update config and save."""
         self.config.set_delegates(self.delegates)
+        self.delegatesChanged.emit()
 
     def columnCount(self, parent=QModelIndex()):
         return self.TOTAL_FIELDS
@@ -103,10 +103,12 @@ class SteemvoteWindow(QMainWindow):
 
     def create_authors_tab(self):
         self.authors_widget = AuthorsWidget(self.config)
+        self.authors_widget.model.authorsChanged.connect(lambda: self.voter.load_settings())
         return self.authors_widget
 
     def create_delegates_tab(self):
         self.delegates_widget = DelegatesWidget(self.config)
+        self.delegates_widget.model.delegatesChanged.connect(lambda: self.voter.load_settings())
         return self.delegates_widget
 
     def timer_actions(self):
@@ -115,7 +117,8 @@ class SteemvoteWindow(QMainWindow):
             # voter will update via RPC once every interval.
             self.voter.update()
 
-            if now - self.last_vote > self.vote_interval:
+            # Vote early if a comment is due.
+            if now - self.last_vote > self.vote_interval or self.voter.scheduler.time_until_due(now) == 0:
                 self.last_vote = now
                 self.voter.vote_for_comments()
         except Exception as e:
@@ -0,0 +1,52 @@
+"""Database migrations.
+
+Each migration moves a database from the previous version to its own
+version. Migrations are run in order by DB.check_version().
+"""
+import peewee
+from playhouse.migrate import SqliteMigrator, migrate
+
+def parse_version(version):
+    """Parse a version string (e.g. "0.2.0") into a tuple of integers."""
+    return tuple(int(i) for i in version.split('.'))
+
+def migrate_0_2_0(database):
+    """Add comment creation times and statuses, and index comment state."""
+    migrator = SqliteMigrator(database)
+    migrate(
+        migrator.add_column('dbcomment', 'created', peewee.IntegerField(null=True)),
+        migrator.add_column('dbcomment', 'status', peewee.CharField(default='tracked')),
+    )
+    # The index may already have been created along with the current tables.
+    database.execute_sql('CREATE INDEX IF NOT EXISTS dbcomment_tracked_voted ON dbcomment (tracked, voted)')
+    database.execute_sql("UPDATE dbcomment SET status = 'voted' WHERE voted = 1")
+
+def migrate_0_3_0(database):
+    """Add comment snapshots."""
+    migrator = SqliteMigrator(database)
+    migrate(
+        migrator.add_column('dbcomment', 'snapshot', peewee.TextField(null=True)),
+    )
+
+def migrate_0_4_0(database):
+    """Make comment statuses the only record of comment state."""
+    database.execute_sql("UPDATE dbcomment SET status = CASE WHEN voted = 1 THEN 'voted' ELSE 'tracked' END")
+    database.execute_sql('DROP INDEX IF EXISTS dbcomment_tracked_voted')
+    migrator = SqliteMigrator(database)
+    migrate(
+        migrator.drop_column('dbcomment', 'tracked'),
+        migrator.drop_column('dbcomment', 'voted'),
+    )
+    database.execute_sql('CREATE INDEX IF NOT EXISTS dbcomment_status_created ON dbcomment (status, created)')
+
+# [(version, migration), ...] in version order.
+migrations = [
+    ('0.2.0', migrate_0_2_0),
+    ('0.3.0', migrate_0_3_0),
+    ('0.4.0', migrate_0_4_0),
+]
+
+def get_pending_migrations(version):
+    """Get the migrations that a database at version needs."""
+    return [(target, migration) for target, migration in migrations
+            if parse_version(target) > parse_version(version)]
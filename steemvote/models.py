@@ -1,10 +1,24 @@
 import datetime
 import enum
 import struct
+import sys
 import time
 
 from piston.steem import Post
 
+def make_identifier(author, permlink):
+    """Get the identifier for the comment at author/permlink."""
+    return '@%s/%s' % (author, permlink)
+
+def parse_identifier(identifier):
+    """Get the (author, permlink) of the comment with identifier."""
+    author, permlink = identifier.split('/', 1)
+    return (author.lstrip('@'), permlink)
+
+def parse_time(value):
+    """Get the Unix timestamp of a chain time string (e.g. "2016-08-01T00:00:00")."""
+    t = datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S')
+    return int(t.replace(tzinfo=datetime.timezone.utc).timestamp())
 
 class Priority(enum.Enum):
     """Constants for author priority values."""
@@ -127,6 +141,9 @@ class Comment(Post):
     def __init__(self, steem, post):
         super(Comment, self).__init__(steem, post)
         self.timestamp = int(self.created_parsed.replace(tzinfo=datetime.timezone.utc).timestamp())
+        # Names of the indexed voters that have voted for this comment.
+        # This is None until index_voters() is called.
+        self.relevant_voters = None
 
     def is_reply(self):
         return True if self.parent_author else False
@@ -136,8 +153,154 @@ class Comment(Post):
         domain = domain.rstrip('/')
         return domain + self.url
 
+    def index_voters(self, voter_names):
+        """Index the votes made by voter_names.
+
+        Only the votes by voter_names are kept, so the cost of checking
+        who has voted does not grow with the number of votes. Votes seen
+        later are recorded with add_voter().
+        """
+        if not isinstance(voter_names, (set, frozenset)):
+            voter_names = set(voter_names)
+        self.active_votes = [d for d in self.active_votes if d['voter'] in voter_names]
+        self.relevant_voters = set(d['voter'] for d in self.active_votes)
+
+    def add_voter(self, name):
+        """Record a vote by name on an indexed comment."""
+        if self.relevant_voters is not None:
+            self.relevant_voters.add(name)
+
     def get_have_voted(self, voter_names):
-        """Get the names in voter_names that have voted for this comment."""
-        active_voters = [d['voter'] for d in self.active_votes]
-        result = set(voter_names).intersection(set(active_voters))
-        return list(result)
+        """Get the names in voter_names that have voted for this comment.
+
+        The cost depends on the number of votes on this comment, so
+        voter_names should be a set or dict if it is large.
+        """
+        if self.relevant_voters is not None:
+            return [i for i in self.relevant_voters if i in voter_names]
+        return [d['voter'] for d in self.active_votes if d['voter'] in voter_names]
+
+class CommentSnapshot(object):
+    """The fields of a comment that voting decisions depend on.
+
+    Snapshots are stored in the database, so that tracked comments can be
+    loaded without fetching their content.
+
+    Many snapshots are kept in memory at once, so they use __slots__ and
+    intern the names that they share with other snapshots. The content
+    of a comment (its title, body and metadata) is not kept, since no
+    decision depends on it.
+    """
+    __slots__ = ('identifier', 'author', 'category', 'parent_author', 'timestamp',
+            'allow_votes', 'allow_curation_rewards', 'relevant_voters', 'stale')
+
+    def __init__(self, author, permlink, category, parent_author, timestamp,
+            allow_votes=True, allow_curation_rewards=True, relevant_voters=None):
+        self.author = sys.intern(author)
+        # The permlink is not stored separately, since it is part of the identifier.
+        self.identifier = make_identifier(self.author, permlink)
+        self.category = sys.intern(category)
+        self.parent_author = sys.intern(parent_author)
+        self.timestamp = int(timestamp)
+        self.allow_votes = bool(allow_votes)
+        self.allow_curation_rewards = bool(allow_curation_rewards)
+        # Names of the indexed voters that have voted for this comment.
+        # There are rarely more than a few, so a tuple is used instead of a set.
+        self.relevant_voters = tuple(sorted(set(sys.intern(i) for i in relevant_voters or ())))
+        # Whether the snapshot may be out of date with the chain.
+        self.stale = False
+
+    @property
+    def permlink(self):
+        return self.identifier[len(self.author) + 2:]
+
+    @classmethod
+    def from_comment(cls, comment):
+        """Create a snapshot of a Comment whose voters have been indexed."""
+        voters = comment.relevant_voters
+        if voters is None:
+            voters = [d['voter'] for d in comment.active_votes]
+        return cls(comment.author, comment.permlink, comment.category, comment.parent_author,
+                comment.timestamp, comment.allow_votes, comment.allow_curation_rewards, voters)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['author'], d['permlink'], d['category'], d['parent_author'], d['timestamp'],
+                d['allow_votes'], d['allow_curation_rewards'], d['voters'])
+
+    def to_dict(self):
+        return {
+            'author': self.author,
+            'permlink': self.permlink,
+            'category': self.category,
+            'parent_author': self.parent_author,
+            'timestamp': self.timestamp,
+            'allow_votes': self.allow_votes,
+            'allow_curation_rewards': self.allow_curation_rewards,
+            'voters': list(self.relevant_voters),
+        }
+
+    def is_reply(self):
+        return True if self.parent_author else False
+
+    def get_url(self, domain='https://steemit.com'):
+        """Get the URL for this comment at domain."""
+        domain = domain.rstrip('/')
+        return '%s/%s/%s' % (domain, self.category, self.identifier)
+
+    def index_voters(self, voter_names):
+        """Forget the votes made by voters other than voter_names."""
+        if not isinstance(voter_names, (set, frozenset)):
+            voter_names = set(voter_names)
+        self.relevant_voters = tuple(i for i in self.relevant_voters if i in voter_names)
+
+    def add_voter(self, name):
+        """Record a vote by name."""
+        if name not in self.relevant_voters:
+            self.relevant_voters = tuple(sorted(self.relevant_voters + (sys.intern(name),)))
+
+    def get_have_voted(self, voter_names):
+        """Get the names in voter_names that have voted for this comment.
+
+        The cost depends on the number of indexed voters, so voter_names
+        should be a set or dict if it is large.
+        """
+        return [i for i in self.relevant_voters if i in voter_names]
+
+def hydrate_comments(steem, identifiers, cache=None):
+    """Get Comments for many identifiers using batched RPC calls.
+
+    If cache is given, content is taken from it when possible, and
+    fetched content is stored in it.
+    Identifiers whose comments do not exist are omitted.
+
+    Returns:
+        A dict of {identifier: Comment, ...}.
+    """
+    contents = {}
+    identifiers = list(set(identifiers))
+    if cache is not None:
+        for identifier in identifiers:
+            content = cache.get(identifier)
+            if content is not None:
+                contents[identifier] = content
+
+    missing = [i for i in identifiers if i not in contents]
+    if missing:
+        fetched = steem.rpc.get_contents([parse_identifier(i) for i in missing])
+        for identifier, content in zip(missing, fetched):
+            # Nonexistent comments have an empty author.
+            if not content or not content.get('author'):
+                continue
+            contents[identifier] = content
+            if cache is not None:
+                cache.put(identifier, content)
+
+    comments = {}
+    for identifier, content in contents.items():
+        try:
+            # Copy the content, since Post modifies it.
+            comments[identifier] = Comment(steem, dict(content))
+        except ValueError:
+            continue
+    return comments
@@ -1,13 +1,17 @@
 import logging
 import sys
 import threading
+import time
 import traceback
 
 from piston.steem import Steem
 
-from steemvote.models import Comment
+from steemvote.blocks import STEEMIT_BLOCK_INTERVAL, BlockFetcher
+from steemvote.models import hydrate_comments, make_identifier, parse_time
 from steemvote.voter import Voter
 
+# Minimum interval between storing the number of the last processed block.
+CURSOR_SAVE_INTERVAL = 1 # 1 second.
 
 class Monitor(threading.Thread):
     """Monitors Steem operations.
@@ -25,6 +29,22 @@ class Monitor(threading.Thread):
         self.logger = logging.getLogger(__name__)
         # There must be authors to monitor.
         self.config.require('authors')
+        # Number of blocks to request at once while catching up.
+        self.block_fetch_window = self.config.get('block_fetch_window')
+        # Whether to follow irreversible blocks or the head block.
+        self.block_stream_mode = self.config.get('block_stream_mode')
+        # Whether to vote on comments as soon as delegates vote for them.
+        # If this is False, the comments are left to the scheduler.
+        self.follow_votes_immediately = True
+        # Number of the last block whose operations were all handled.
+        self.last_block = None
+        # Timestamp of the block whose operations are being handled.
+        self.block_time = None
+        # Last time that the last block number was stored.
+        self.last_cursor_save = 0
+        # Operations whose comments are waiting to be fetched.
+        # [(op_name, op), ...]
+        self.hydration_queue = []
 
         # Set up operation handlers.
         self.op_handlers = {}
@@ -65,35 +85,113 @@ class Monitor(threading.Thread):
                 self.logger.error(str(e))
                 self.logger.error(''.join(traceback.format_tb(sys.exc_info()[2])))
                 break
+        self.save_cursor(force=True)
         self.logger.debug('Monitor thread stopped')
 
+    def get_start_block(self, head):
+        """Get the number of the block to start streaming at.
+
+        Streaming resumes after the last processed block. Blocks older than
+        max_post_age are skipped, since their comments cannot be tracked.
+        """
+        cursor = self.db.get_last_block()
+        if cursor is None:
+            return head
+        max_post_age = self.voter.rules.max_post_age
+        oldest = max(head - max_post_age // STEEMIT_BLOCK_INTERVAL, 1)
+        return max(cursor + 1, oldest)
+
+    def save_cursor(self, force=False):
+        """Store the number of the last processed block.
+
+        The block number is stored at most once every CURSOR_SAVE_INTERVAL
+        seconds unless force is True. Blocks that are processed again after
+        a restart are harmless, since tracking a comment is idempotent.
+        """
+        if self.last_block is None:
+            return
+        now = time.time()
+        if not force and now - self.last_cursor_save < CURSOR_SAVE_INTERVAL:
+            return
+        self.db.set_last_block(self.last_block)
+        self.last_cursor_save = now
+
     def stream(self):
         """Stream operations that have handlers."""
-        for block in self.steem.rpc.block_stream():
+        fetcher = BlockFetcher(self.steem.rpc, window=self.block_fetch_window, mode=self.block_stream_mode)
+        for block_num, block in fetcher.stream(self.get_start_block(fetcher.get_head_block_number())):
+            self.block_time = parse_time(block['timestamp'])
             for tx in block['transactions']:
                 for op in tx['operations']:
                     if self.has_handler(op[0]):
                         yield op
+            self.flush_hydration_queue()
+            # Handlers have been called for all of this block's operations.
+            self.last_block = block_num
+            self.save_cursor()
 
     def has_handler(self, op_name):
         """Get whether there is a handler for op_name operations."""
         return hasattr(self, 'on_%s' % op_name)
 
+    def flush_hydration_queue(self):
+        """Fetch the comments of queued operations and track them if eligible.
+
+        All of the comments are fetched with batched RPC calls.
+        """
+        if not self.hydration_queue:
+            return
+        queue, self.hydration_queue = self.hydration_queue, []
+        comments = hydrate_comments(self.steem, [make_identifier(op['author'], op['permlink']) for _, op in queue],
+                self.voter.content_cache)
+        for op_name, op in queue:
+            comment = comments.get(make_identifier(op['author'], op['permlink']))
+            if not comment:
+                self.logger.debug('Invalid comment. Skipping')
+                continue
+            self.track_comment(op_name, op, comment)
+
+    def track_comment(self, op_name, op, comment):
+        """Track comment if it is eligible, given the operation that it was in."""
+        comment.index_voters(self.voter.get_watched_voters())
+        added = False
+        if op_name == 'comment':
+            if self.voter.should_track_for_author(comment).track:
+                added = self.db.add_comment_with_author(comment)
+        elif op_name == 'vote':
+            if self.voter.should_track_for_delegate(comment).track:
+                added = self.db.add_comment_with_delegate(comment, self.config.get_delegate(op['voter']).name)
+        if added:
+            self.voter.schedule_comment(comment)
+            if op_name == 'vote' and self.follow_votes_immediately:
+                self.voter.vote_now(comment.identifier)
+
     def on_comment(self, d):
         """Handler for comment operations."""
-        try:
-            comment = Comment(self.steem, d)
-            if self.voter.should_track_for_author(comment).track:
-                self.db.add_comment_with_author(comment)
-        except ValueError as e:
-            self.logger.debug('Invalid comment. Skipping')
+        self.voter.content_cache.on_comment_op(d)
+        # Skip comments that cannot be tracked without fetching them.
+        if not self.voter.prescreen_comment_op(d).track:
+            return
+        if self.db.is_tracked(make_identifier(d['author'], d['permlink'])):
+            return
+        self.hydration_queue.append(('comment', d))
 
     def on_vote(self, d):
-        if not self.config.get_delegate(d['voter']):
+        """Handler for vote operations."""
+        self.voter.content_cache.on_vote_op(d)
+        # Keep the voter index of a tracked comment current.
+        if self.voter.is_watched_voter(d['voter']):
+            identifier = make_identifier(d['author'], d['permlink'])
+            self.db.record_vote(identifier, d['voter'])
+            if d['voter'] == self.voter.name:
+                self.voter.on_own_vote_op(d, self.block_time)
+            else:
+                self.voter.on_watched_vote(identifier)
+                if self.follow_votes_immediately:
+                    self.voter.vote_now(identifier)
+        # Skip comments that cannot be tracked without fetching them.
+        if not self.voter.prescreen_vote_op(d).track:
             return
-        try:
-            comment = Comment(self.steem, d)
-            if self.voter.should_track_for_delegate(comment).track:
-                self.db.add_comment_with_delegate(comment, self.config.get_delegate(d['voter']).name)
-        except ValueError as e:
-            self.logger.debug('Invalid comment. Skipping')
+        if self.db.is_tracked(make_identifier(d['author'], d['permlink'])):
+            return
+        self.hydration_queue.append(('vote', d))
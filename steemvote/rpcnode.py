@@ -1,39 +1,380 @@
+from concurrent.futures import Future
+import itertools
+import json
+import logging
 import threading
+import time
 
+from grapheneapi.graphenewsrpc import NumRetriesReached, RPCError
 from steemapi.steemnoderpc import SteemNodeRPC
 from piston.steem import Steem
 
+# Weight of the latest call when updating a connection's average latency.
+LATENCY_SMOOTHING = 0.2
+# A connection is ejected if its average latency is this many times
+# the average latency of the fastest connection.
+SLOW_CONNECTION_FACTOR = 5.0
+# Interval for probing ejected connections.
+PROBE_INTERVAL = 30 # 30 seconds.
+# Maximum number of requests to send in one batch.
+MAX_BATCH_SIZE = 100
+# Number of times that a connection to a single node retries by default.
+# As with grapheneapi's connections, -1 retries forever.
+DEFAULT_NUM_RETRIES = -1
+
+class BatchNotSupported(Exception):
+    """Exception raised when a node cannot handle batch requests."""
+    pass
+
 
 class SteemvoteRPC(SteemNodeRPC):
-    """Temporary work-around for RPC threading problems."""
+    """RPC connection that allows concurrent calls from several threads.
+
+    Each request is tagged with an id, so any number of requests can be
+    outstanding on the websocket at once. A reader thread routes each
+    response back to the thread that made the request.
+
+    Several requests can also be sent as one JSON-RPC batch. If the node
+    does not support batches, the requests are sent one after another
+    without waiting for responses in between.
+    """
     def __init__(self, *args, **kwargs):
+        # These must exist before the parent class connects and logs in.
+        self.logger = logging.getLogger(__name__)
+        self.batch_supported = True
+        self.request_ids = itertools.count(1)
+        self.send_lock = threading.Lock()
+        self.connect_lock = threading.RLock()
+        # {request_id: (websocket, future, is_batch), ...}
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        # The websocket that the reader thread is reading from.
+        self.reader_ws = None
         super(SteemvoteRPC, self).__init__(*args, **kwargs)
-        self.rpc_lock = threading.Lock()
 
-    def get_account(self, name):
-        with self.rpc_lock:
-            result = super(SteemvoteRPC, self).get_account(name)
-        return result
+    def get_request_id(self):
+        return next(self.request_ids)
+
+    def ensure_reader(self):
+        """Start a reader thread for the current websocket if necessary.
+
+        Returns:
+            The current websocket.
+        """
+        with self.connect_lock:
+            ws = self.ws
+            if self.reader_ws is not ws:
+                self.reader_ws = ws
+                reader = threading.Thread(target=self.read_responses, args=(ws,), daemon=True)
+                reader.start()
+        return ws
+
+    def read_responses(self, ws):
+        """Route responses on ws to the threads waiting for them."""
+        while True:
+            try:
+                message = json.loads(ws.recv(), strict=False)
+            except Exception:
+                break
+            # A batch request is answered with a list of responses.
+            responses = message if isinstance(message, list) else [message]
+            for response in responses:
+                if not isinstance(response, dict):
+                    continue
+                with self.pending_lock:
+                    request = self.pending.pop(response.get('id'), None)
+                if request:
+                    request[1].set_result(response)
+                # A node that cannot parse a batch answers with one error.
+                elif response.get('id') is None and 'error' in response:
+                    self.fail_pending(ws, BatchNotSupported(), batch_only=True)
+
+        self.fail_pending(ws, ConnectionError('Connection to %s was lost' % self.url))
+
+    def fail_pending(self, ws, error, batch_only=False):
+        """Fail the requests that were sent on ws."""
+        with self.pending_lock:
+            failed = [request_id for request_id, (request_ws, _, is_batch) in self.pending.items()
+                        if request_ws is ws and (is_batch or not batch_only)]
+            for request_id in failed:
+                self.pending.pop(request_id)[1].set_exception(error)
+
+    def reconnect(self, ws):
+        """Reconnect if ws is still the current websocket."""
+        with self.connect_lock:
+            if self.ws is ws:
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+                self.wsconnect()
+
+    def make_payload(self, method, *args):
+        """Make a request payload for a database API method."""
+        return {'method': 'call', 'params': [0, method, list(args)], 'jsonrpc': '2.0', 'id': self.get_request_id()}
+
+    def rpcexec(self, payload):
+        """Send payload and wait for its response."""
+        return self.rpcexec_many([payload])[0]
+
+    def rpcexec_many(self, payloads, batch=False):
+        """Send payloads and wait for all of their responses.
+
+        If batch is True, payloads are sent as one batch request.
+
+        Returns:
+            The results of payloads, in the same order.
+        """
+        cnt = 0
+        while True:
+            cnt += 1
+            ws = self.ensure_reader()
+            futures = []
+            with self.pending_lock:
+                for payload in payloads:
+                    future = Future()
+                    self.pending[payload['id']] = (ws, future, batch)
+                    futures.append(future)
+            try:
+                with self.send_lock:
+                    if batch:
+                        ws.send(json.dumps(payloads, ensure_ascii=False).encode('utf8'))
+                    else:
+                        for payload in payloads:
+                            ws.send(json.dumps(payload, ensure_ascii=False).encode('utf8'))
+                responses = [future.result() for future in futures]
+                break
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                with self.pending_lock:
+                    for payload in payloads:
+                        self.pending.pop(payload['id'], None)
+                # Don't retry batches, since the node may have dropped
+                # the connection because it cannot handle them.
+                if batch:
+                    raise BatchNotSupported() from e
+                if self.num_retries > -1 and cnt > self.num_retries:
+                    raise NumRetriesReached()
+                time.sleep(min((cnt - 1) * 2, 10))
+                self.reconnect(ws)
+
+        results = []
+        for response in responses:
+            if 'error' in response:
+                error = response['error']
+                raise RPCError(error.get('detail', error.get('message')))
+            results.append(response['result'])
+        return results
+
+    def call_many(self, method, args_list):
+        """Call method once for each set of arguments in args_list.
+
+        Calls are sent in batches of MAX_BATCH_SIZE.
+
+        Returns:
+            The results of the calls, in the same order.
+        """
+        results = []
+        for i in range(0, len(args_list), MAX_BATCH_SIZE):
+            chunk = args_list[i:i + MAX_BATCH_SIZE]
+            if self.batch_supported:
+                try:
+                    results.extend(self.rpcexec_many([self.make_payload(method, *args) for args in chunk], batch=True))
+                    continue
+                except BatchNotSupported:
+                    self.logger.info('%s does not support batch requests' % self.url)
+                    self.batch_supported = False
+            results.extend(self.rpcexec_many([self.make_payload(method, *args) for args in chunk]))
+        return results
+
+    def get_contents(self, identifiers):
+        """Get the content of many comments.
 
-    def get_block(self, num):
-        with self.rpc_lock:
-            result = super(SteemvoteRPC, self).__getattr__('get_block')(num)
-        return result
+        Args:
+            identifiers: A list of (author, permlink) 2-tuples.
+        """
+        return self.call_many('get_content', [list(i) for i in identifiers])
 
-    def get_content(self, author, permlink):
-        with self.rpc_lock:
-            result = super(SteemvoteRPC, self).__getattr__('get_content')(author, permlink)
-        return result
+class PooledConnection(object):
+    """A connection in an RPCPool, along with its health stats."""
+    def __init__(self, url):
+        self.url = url
+        self.rpc = None
+        # Number of calls currently using this connection.
+        self.in_flight = 0
+        # Exponentially-weighted average latency in seconds.
+        self.latency = None
+        self.ejected = True
 
-    def get_dynamic_global_properties(self):
-        with self.rpc_lock:
-            result = super(SteemvoteRPC, self).__getattr__('get_dynamic_global_properties')()
-        return result
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+class RPCPool(object):
+    """Pool of RPC connections to one or more nodes.
+
+    Each call is sent to the healthy connection with the fewest calls
+    in flight, and then the lowest average latency. Connections that
+    fail or are much slower than the fastest connection are ejected,
+    and a background thread probes them until they recover.
+
+    Attributes that are not defined here are RPC methods, as with
+    SteemvoteRPC.
+    """
+    def __init__(self, urls, user='', password='', connections_per_node=2, num_retries=1):
+        if not urls:
+            raise ValueError('At least one node is required')
+        self.logger = logging.getLogger(__name__)
+        self.user = user
+        self.password = password
+        self.num_retries = num_retries
+        self.lock = threading.Lock()
+        self.connections = [PooledConnection(url) for url in urls for _ in range(connections_per_node)]
+
+        for conn in self.connections:
+            self.probe(conn)
+        if not self.get_healthy_connections():
+            raise Exception('Could not connect to any node')
+
+        self.prober = threading.Thread(target=self.probe_forever, daemon=True)
+        self.prober.start()
+
+    @property
+    def url(self):
+        """The URL of the preferred node."""
+        with self.lock:
+            conn = self.best_connection(self.connections)
+        return conn.url
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        return method
+
+    def get_healthy_connections(self):
+        with self.lock:
+            return [i for i in self.connections if not i.ejected]
+
+    def best_connection(self, candidates):
+        """Get the best connection in candidates.
+
+        Healthy connections are preferred over ejected ones.
+        """
+        return min(candidates, key=lambda i: (i.ejected, i.in_flight, i.latency or 0.0))
+
+    def choose_connection(self, exclude=()):
+        """Reserve the best connection that is not in exclude.
+
+        Ejected connections are only chosen if every healthy
+        connection is in exclude.
+        """
+        with self.lock:
+            candidates = [i for i in self.connections if i.rpc and i not in exclude]
+            if not candidates:
+                return None
+            conn = self.best_connection(candidates)
+            conn.in_flight += 1
+        return conn
+
+    def eject(self, conn, reason):
+        with self.lock:
+            if conn.ejected:
+                return
+            conn.ejected = True
+        self.logger.warning('Ejected connection to %s (%s)' % (conn.url, reason))
+
+    def call(self, name, *args, **kwargs):
+        """Call an RPC method using the best available connection."""
+        tried = []
+        while True:
+            conn = self.choose_connection(exclude=tried)
+            if not conn:
+                raise Exception('No RPC connections are available for %s' % name)
+            tried.append(conn)
+            start = time.time()
+            try:
+                result = getattr(conn.rpc, name)(*args, **kwargs)
+            except RPCError:
+                # The node handled the call, so the connection is healthy.
+                self.release(conn, time.time() - start)
+                raise
+            except Exception as e:
+                self.release(conn, None)
+                self.logger.debug('Call to %s on %s failed: %s' % (name, conn.url, str(e)))
+                continue
+            self.release(conn, time.time() - start)
+            return result
+
+    def release(self, conn, latency):
+        """Update conn's stats after a call.
+
+        latency is None if the call failed.
+        """
+        with self.lock:
+            conn.in_flight -= 1
+            failed = latency is None
+            if not failed:
+                conn.record_latency(latency)
+            healthy = [i.latency for i in self.connections if not i.ejected and i.latency is not None]
+            slow = (len(healthy) > 1 and conn.latency is not None
+                    and conn.latency > SLOW_CONNECTION_FACTOR * min(healthy))
+        if failed:
+            self.eject(conn, 'call failed')
+        elif slow:
+            self.eject(conn, 'too slow')
+
+    def probe(self, conn):
+        """Try to (re)connect conn and reinstate it if it responds."""
+        try:
+            start = time.time()
+            if conn.rpc is None:
+                conn.rpc = SteemvoteRPC(conn.url, user=self.user, password=self.password,
+                        num_retries=self.num_retries)
+            else:
+                conn.rpc.wsconnect()
+            conn.rpc.get_dynamic_global_properties()
+        except Exception as e:
+            self.logger.debug('Probe of %s failed: %s' % (conn.url, str(e)))
+            return False
+        with self.lock:
+            # Start from the probe's latency, so that a recovered node
+            # is not judged by the latency that got it ejected.
+            conn.latency = time.time() - start
+            conn.ejected = False
+        self.logger.debug('Connection to %s is available' % conn.url)
+        return True
+
+    def probe_forever(self):
+        while True:
+            time.sleep(PROBE_INTERVAL)
+            with self.lock:
+                ejected = [i for i in self.connections if i.ejected]
+            for conn in ejected:
+                self.probe(conn)
 
 class SteemvoteSteem(Steem):
-    """Subclass of Steem with a work-around for RPC threading problems."""
-    def _connect(self, *args, **kwargs):
-        super(SteemvoteSteem, self)._connect(*args, **kwargs)
-        self.rpc = SteemvoteRPC(self.rpc.url, user=self.rpc.user,
-                password=self.rpc.password, num_retries=self.rpc.num_retries)
+    """Subclass of Steem that uses a pool of RPC connections.
+
+    If rpc_nodes is not given, the pool only connects to the node
+    that Steem was instantiated with.
+    """
+    def __init__(self, *args, rpc_nodes=None, connections_per_node=2, **kwargs):
+        self.rpc_nodes = rpc_nodes
+        self.connections_per_node = connections_per_node
+        super(SteemvoteSteem, self).__init__(*args, **kwargs)
 
+    def _connect(self, node='', rpcuser='', rpcpassword='', **kwargs):
+        # Steem._connect() would open a connection that the pool replaces,
+        # so the pool is created from the arguments instead.
+        nodes = self.rpc_nodes or ([node] if node else [])
+        if not nodes:
+            raise ValueError('A Steem node needs to be provided!')
+        # With several nodes, fail over quickly instead of retrying one node.
+        num_retries = kwargs.get('num_retries', DEFAULT_NUM_RETRIES) if len(nodes) == 1 else 1
+        self.rpc = RPCPool(nodes, user=rpcuser, password=rpcpassword,
+                connections_per_node=self.connections_per_node, num_retries=num_retries)
@@ -0,0 +1,60 @@
+from types import MappingProxyType
+
+from steemvote.models import Priority
+
+class VotingRules(object):
+    """Settings that voting decisions are made with.
+
+    Rules are immutable. When the settings change, a new VotingRules is
+    created and swapped in, so a thread that reads the rules once sees
+    one consistent set of settings without taking a lock.
+    """
+    __slots__ = ('min_post_age', 'max_post_age', 'priority_voting_powers',
+            'blacklisted_authors', 'blacklisted_categories', 'authors', 'delegates',
+            'watched_voters')
+
+    def __init__(self, min_post_age, max_post_age, priority_voting_powers,
+            blacklisted_authors=(), blacklisted_categories=(), authors=(), delegates=(), voter_name=''):
+        if min_post_age > max_post_age:
+            raise ValueError('Minimum post age cannot be more than maximum post age')
+        if not priority_voting_powers[Priority.low] >= priority_voting_powers[Priority.normal] >= priority_voting_powers[Priority.high]:
+            raise ValueError('Priority voting powers must be: low >= normal >= high')
+
+        set_attr = super(VotingRules, self).__setattr__
+        # Minimum age of posts to vote for.
+        set_attr('min_post_age', min_post_age)
+        # Maximum age of posts to vote for.
+        set_attr('max_post_age', max_post_age)
+        # Required remaining voting power to vote for each priority of comments.
+        set_attr('priority_voting_powers', MappingProxyType(dict(priority_voting_powers)))
+        # Authors to ignore posts by.
+        set_attr('blacklisted_authors', frozenset(blacklisted_authors))
+        # Categories to ignore posts in.
+        set_attr('blacklisted_categories', frozenset(blacklisted_categories))
+        # {name: Author, ...}
+        set_attr('authors', MappingProxyType({i.name: i for i in authors}))
+        # {name: Delegate, ...}
+        set_attr('delegates', MappingProxyType({i.name: i for i in delegates}))
+        # Names of the voters whose votes on tracked comments matter.
+        # These are the delegates and the voter.
+        set_attr('watched_voters', frozenset(self.delegates.keys()).union([voter_name]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Voting rules cannot be changed')
+
+    @classmethod
+    def from_config(cls, config, voter_name):
+        """Create rules from the current settings in config."""
+        priorities = {
+            Priority.low: config.get_decimal('priority_low'),
+            Priority.normal: config.get_decimal('priority_normal'),
+            Priority.high: config.get_decimal('priority_high'),
+        }
+        return cls(config.get_seconds('min_post_age'), config.get_seconds('max_post_age'), priorities,
+                config.get('blacklist_authors'), config.get('blacklist_categories'),
+                config.authors, config.delegates, voter_name)
+
+    def get_voted_delegates(self, comment):
+        """Get the delegates that have voted on comment."""
+        delegates = self.delegates
+        return [delegates[i] for i in comment.get_have_voted(delegates)]
@@ -0,0 +1,187 @@
+import heapq
+import itertools
+import threading
+import time
+
+class VoteScheduler(object):
+    """Schedules tracked comments by when they should next be evaluated.
+
+    Comments are kept in a heap ordered by their due times, so only the
+    comments that are due need to be looked at. Waiting threads are woken
+    whenever a comment is scheduled earlier than every other comment.
+    """
+    def __init__(self):
+        self.condition = threading.Condition()
+        # [(due_time, sequence, identifier), ...]
+        # Entries whose due time no longer matches due_times are stale.
+        self.heap = []
+        # {identifier: due_time, ...}
+        self.due_times = {}
+        self.sequence = itertools.count()
+        # Callbacks for when the next due time moves earlier.
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.due_times)
+
+    def __contains__(self, identifier):
+        return identifier in self.due_times
+
+    def add_listener(self, callback):
+        """Call callback whenever the next due time moves earlier."""
+        self.listeners.append(callback)
+
+    def _discard_stale(self):
+        """Remove stale entries from the top of the heap."""
+        while self.heap:
+            due_time, _, identifier = self.heap[0]
+            if self.due_times.get(identifier) == due_time:
+                return
+            heapq.heappop(self.heap)
+
+    def schedule(self, identifier, due_time):
+        """Schedule identifier to be due at due_time.
+
+        This replaces any previous due time for identifier.
+        """
+        with self.condition:
+            self._discard_stale()
+            earliest = self.heap[0][0] if self.heap else None
+            self.due_times[identifier] = due_time
+            heapq.heappush(self.heap, (due_time, next(self.sequence), identifier))
+            moved_earlier = earliest is None or due_time < earliest
+            if moved_earlier:
+                self.condition.notify_all()
+        if moved_earlier:
+            for callback in self.listeners:
+                callback()
+
+    def schedule_all(self, due_time):
+        """Make every scheduled identifier due at due_time."""
+        with self.condition:
+            identifiers = list(self.due_times.keys())
+        for identifier in identifiers:
+            self.schedule(identifier, due_time)
+
+    def unschedule(self, identifiers):
+        """Stop scheduling identifiers."""
+        with self.condition:
+            for identifier in identifiers:
+                self.due_times.pop(identifier, None)
+
+    def get_due_time(self, identifier):
+        """Get the due time of identifier, or None if it is not scheduled."""
+        with self.condition:
+            return self.due_times.get(identifier)
+
+    def pop_due(self, now=None):
+        """Remove and return the identifiers that are due at now."""
+        if now is None:
+            now = time.time()
+        due = []
+        with self.condition:
+            while True:
+                self._discard_stale()
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                _, _, identifier = heapq.heappop(self.heap)
+                del self.due_times[identifier]
+                due.append(identifier)
+        return due
+
+    def time_until_due(self, now=None):
+        """Get the seconds until the next identifier is due.
+
+        Returns None if nothing is scheduled.
+        """
+        if now is None:
+            now = time.time()
+        with self.condition:
+            self._discard_stale()
+            if not self.heap:
+                return None
+            return max(self.heap[0][0] - now, 0.0)
+
+    def wait(self, timeout):
+        """Wait until an identifier is due, for at most timeout seconds."""
+        with self.condition:
+            delay = self.time_until_due()
+            if delay is not None:
+                timeout = min(timeout, delay)
+            if timeout > 0:
+                self.condition.wait(timeout)
+
+class ExpiryWheel(object):
+    """Timer wheel of identifiers, bucketed by comment creation time.
+
+    Adding and removing an identifier are O(1), and expiring identifiers
+    only looks at the buckets older than the cutoff. Since identifiers are
+    bucketed by creation time rather than by expiration time, the maximum
+    age can change without the wheel being rebuilt.
+    """
+    def __init__(self, resolution=60):
+        if resolution < 1:
+            raise ValueError('Expiry wheel resolution must be at least 1 second')
+        self.resolution = resolution
+        self.lock = threading.Lock()
+        # {tick: {identifier: timestamp, ...}, ...}
+        self.buckets = {}
+        # {identifier: tick, ...}
+        self.ticks = {}
+        # The oldest tick that may have a bucket.
+        self.first_tick = None
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __contains__(self, identifier):
+        return identifier in self.ticks
+
+    def add(self, identifier, timestamp):
+        """Add identifier for a comment created at timestamp."""
+        tick = int(timestamp // self.resolution)
+        with self.lock:
+            self._remove(identifier)
+            self.buckets.setdefault(tick, {})[identifier] = timestamp
+            self.ticks[identifier] = tick
+            if self.first_tick is None or tick < self.first_tick:
+                self.first_tick = tick
+
+    def _remove(self, identifier):
+        tick = self.ticks.pop(identifier, None)
+        if tick is None:
+            return
+        bucket = self.buckets[tick]
+        del bucket[identifier]
+        if not bucket:
+            del self.buckets[tick]
+
+    def remove(self, identifiers):
+        """Remove identifiers."""
+        with self.lock:
+            for identifier in identifiers:
+                self._remove(identifier)
+
+    def pop_expired(self, cutoff):
+        """Remove and return the identifiers created before cutoff."""
+        expired = []
+        cutoff_tick = int(cutoff // self.resolution)
+        with self.lock:
+            if self.first_tick is None:
+                return expired
+            # Every identifier in the buckets before cutoff_tick has expired.
+            for tick in range(self.first_tick, cutoff_tick):
+                bucket = self.buckets.pop(tick, None)
+                if bucket:
+                    expired.extend(bucket.keys())
+            for identifier in expired:
+                del self.ticks[identifier]
+            self.first_tick = max(self.first_tick, cutoff_tick) if self.ticks else None
+
+            # Only some of the identifiers in cutoff_tick's bucket may have expired.
+            bucket = self.buckets.get(cutoff_tick, {})
+            for identifier, timestamp in list(bucket.items()):
+                if timestamp < cutoff:
+                    self._remove(identifier)
+                    expired.append(identifier)
+        return expired
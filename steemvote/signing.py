@@ -0,0 +1,191 @@
+import abc
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+from itertools import repeat
+import logging
+import multiprocessing
+import struct
+
+from steembase import transactions
+
+from steemvote.transactions import DEFAULT_EXPIRATION, build_vote_transaction
+
+try:
+    import ecdsa
+except ImportError:
+    ecdsa = None
+
+try:
+    import secp256k1
+except ImportError:
+    secp256k1 = None
+
+def set_signature(tx, signature, recovery_id):
+    """Set the only signature of tx.
+
+    Args:
+        signature: The 64-byte compact signature.
+        recovery_id: The recovery ID of the signing public key.
+    """
+    # Compact signature header for a compressed public key.
+    header = struct.pack('<B', recovery_id + 4 + 27)
+    tx.data['signatures'] = transactions.Array([transactions.Signature(header + signature)])
+
+class SignerBackend(object, metaclass=abc.ABCMeta):
+    """Base class for transaction signer backends."""
+    # Name used to select the backend in the config.
+    name = ''
+
+    @classmethod
+    def is_available(cls):
+        """Get whether the backend can be used."""
+        return True
+
+    @abc.abstractmethod
+    def sign(self, tx, wif):
+        """Sign tx with wif and return it."""
+
+class EcdsaSigner(SignerBackend):
+    """Signs transactions with the pure-Python ecdsa package.
+
+    This is the fallback backend. It is slow, but it only needs the
+    ecdsa package, which steembase depends on.
+    """
+    name = 'ecdsa'
+
+    @classmethod
+    def is_available(cls):
+        return ecdsa is not None
+
+    def sign(self, tx, wif):
+        tx.deriveDigest('STEEM')
+        key = ecdsa.SigningKey.from_string(bytes(transactions.PrivateKey(wif)), curve=ecdsa.SECP256k1)
+        generator = ecdsa.SECP256k1.generator
+        order = generator.order()
+        # Non-canonical signatures are rejected by the chain, so
+        # different nonces are tried until a canonical one is found.
+        attempt = 0
+        while True:
+            attempt += 1
+            k = ecdsa.rfc6979.generate_k(order, key.privkey.secret_multiplier, hashlib.sha256,
+                    hashlib.sha256(tx.digest + struct.pack('<I', attempt)).digest())
+            signature = key.sign_digest(tx.digest, sigencode=ecdsa.util.sigencode_string, k=k)
+            if tx._is_canonical(signature):
+                break
+        # The recovery ID identifies the point R = k * G that r was taken from.
+        point = generator * k
+        recovery_id = (point.y() & 1) | (2 if point.x() >= order else 0)
+        set_signature(tx, signature, recovery_id)
+        return tx
+
+class Secp256k1Signer(SignerBackend):
+    """Signs transactions with libsecp256k1.
+
+    This requires the secp256k1 package. Signatures are created the
+    same way that steembase creates them when it uses libsecp256k1.
+    """
+    name = 'secp256k1'
+
+    @classmethod
+    def is_available(cls):
+        return secp256k1 is not None
+
+    def sign(self, tx, wif):
+        tx.deriveDigest('STEEM')
+        private_key = secp256k1.PrivateKey(bytes(transactions.PrivateKey(wif)), raw=True)
+        # Older versions of the secp256k1 package keep a context for each key.
+        ctx = getattr(private_key, 'ctx', None) or secp256k1.secp256k1_ctx
+        # Non-canonical signatures are rejected by the chain, so
+        # different nonces are tried until a canonical one is found.
+        ndata = secp256k1.ffi.new('const int *ndata')
+        ndata[0] = 0
+        while True:
+            ndata[0] += 1
+            sig = secp256k1.ffi.new('secp256k1_ecdsa_recoverable_signature *')
+            signed = secp256k1.lib.secp256k1_ecdsa_sign_recoverable(ctx, sig, tx.digest,
+                    private_key.private_key, secp256k1.ffi.NULL, ndata)
+            if signed != 1:
+                raise Exception('Failed to sign transaction')
+            signature, recovery_id = private_key.ecdsa_recoverable_serialize(sig)
+            if tx._is_canonical(signature):
+                break
+        set_signature(tx, signature, recovery_id)
+        return tx
+
+# Backends in order of preference.
+backends = [Secp256k1Signer, EcdsaSigner]
+
+def get_backend(name='auto'):
+    """Get a signer backend by name.
+
+    If name is "auto", the most preferred available backend is returned.
+    """
+    for cls in backends:
+        if name in ('auto', cls.name) and cls.is_available():
+            return cls()
+    if name in [cls.name for cls in backends]:
+        raise ValueError('Signer backend "%s" is not available' % name)
+    raise ValueError('Unknown signer backend "%s"' % name)
+
+def _build_vote_transaction(backend_name, voter, votes, props, wif, expiration):
+    """Build a vote transaction in a worker process."""
+    return build_vote_transaction(voter, votes, props, wif, expiration, get_backend(backend_name))
+
+class SigningService(object):
+    """Signs vote transactions, optionally in a pool of processes.
+
+    Signing is CPU-bound, so signing in other processes keeps it from
+    competing with the rest of steemvoter for the GIL.
+    """
+    def __init__(self, backend='auto', processes=0):
+        if processes < 0:
+            raise ValueError('Number of signing processes cannot be negative')
+        self.logger = logging.getLogger(__name__)
+        self.backend = get_backend(backend)
+        self.processes = processes
+        self.pool = None
+        if processes:
+            # Worker processes are spawned rather than forked, since forking a
+            # process with running threads can copy locks that are held.
+            self.pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        self.logger.debug('Signing with %s backend in %s' % (self.backend.name,
+                '%d processes' % processes if processes else 'the calling thread'))
+
+    def build_vote_transaction(self, voter, votes, props, wif, expiration=DEFAULT_EXPIRATION):
+        """Build and sign a transaction that votes for comments.
+
+        This takes the same arguments as transactions.build_vote_transaction().
+        """
+        if not self.pool:
+            return build_vote_transaction(voter, votes, props, wif, expiration, self.backend)
+        future = self.pool.submit(_build_vote_transaction, self.backend.name, voter, votes, props, wif, expiration)
+        return future.result()
+
+    def build_vote_transactions(self, voter, batches, props, wif):
+        """Build and sign several transactions that vote for comments.
+
+        With a pool, every transaction is submitted before any result is
+        waited for, so that all of the processes sign at once.
+
+        Args:
+            batches: A list of (votes, expiration) 2-tuples, one for
+                each transaction.
+
+        Returns:
+            The signed transactions, in the order of batches.
+        """
+        if not batches:
+            return []
+        votes, expirations = zip(*batches)
+        if not self.pool:
+            return [build_vote_transaction(voter, i, props, wif, expiration, self.backend)
+                    for i, expiration in zip(votes, expirations)]
+        # Send each process a few transactions at a time.
+        chunksize = max(len(batches) // (self.processes * 4), 1)
+        return list(self.pool.map(_build_vote_transaction, repeat(self.backend.name), repeat(voter), votes,
+                repeat(props), repeat(wif), expirations, chunksize=chunksize))
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
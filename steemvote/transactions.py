@@ -0,0 +1,133 @@
+from binascii import unhexlify
+import struct
+import threading
+import time
+
+from steembase import transactions
+
+from steemvote.models import parse_identifier
+
+STEEMIT_1_PERCENT = 100
+# Default number of seconds until a transaction expires.
+DEFAULT_EXPIRATION = 60 # 1 minute.
+# Maximum number of seconds until a transaction expires that the chain accepts.
+STEEMIT_MAX_TIME_UNTIL_EXPIRATION = 60*60 # 1 hour.
+# Minimum number of seconds that a pre-signed transaction must have left to be used.
+MIN_PRESIGNED_LIFETIME = 15 # 15 seconds.
+
+def get_block_params(props):
+    """Get the reference block parameters for a transaction.
+
+    Args:
+        props: The result of get_dynamic_global_properties().
+
+    Returns:
+        A 2-tuple of (ref_block_num, ref_block_prefix).
+    """
+    ref_block_num = props['head_block_number'] & 0xFFFF
+    ref_block_prefix = struct.unpack_from('<I', unhexlify(props['head_block_id']), 4)[0]
+    return (ref_block_num, ref_block_prefix)
+
+def create_vote_transaction(voter, votes, props, expiration=DEFAULT_EXPIRATION):
+    """Create an unsigned transaction that votes for comments.
+
+    Args:
+        voter: The name of the account to vote with.
+        votes: A list of (identifier, weight) 2-tuples.
+        props: The result of get_dynamic_global_properties().
+        expiration: The number of seconds until the transaction expires.
+
+    Returns:
+        A steembase Signed_Transaction without signatures.
+    """
+    ops = []
+    for identifier, weight in votes:
+        author, permlink = parse_identifier(identifier)
+        op = transactions.Vote(**{
+            'voter': voter,
+            'author': author,
+            'permlink': permlink,
+            'weight': int(weight * STEEMIT_1_PERCENT),
+        })
+        ops.append(transactions.Operation(op))
+
+    ref_block_num, ref_block_prefix = get_block_params(props)
+    return transactions.Signed_Transaction(
+        ref_block_num=ref_block_num,
+        ref_block_prefix=ref_block_prefix,
+        expiration=transactions.formatTimeFromNow(expiration),
+        operations=ops
+    )
+
+def build_vote_transaction(voter, votes, props, wif, expiration=DEFAULT_EXPIRATION, signer=None):
+    """Build and sign a transaction that votes for comments.
+
+    Args:
+        voter: The name of the account to vote with.
+        votes: A list of (identifier, weight) 2-tuples.
+        props: The result of get_dynamic_global_properties().
+        wif: The private key to sign with.
+        expiration: The number of seconds until the transaction expires.
+        signer: The signer backend to sign with. If None, steembase
+            signs the transaction.
+
+    Returns:
+        The signed transaction as a dict that can be broadcast.
+    """
+    tx = create_vote_transaction(voter, votes, props, expiration)
+    if signer:
+        tx = signer.sign(tx, wif)
+    else:
+        tx = tx.sign([wif])
+    return transactions.JsonObj(tx)
+
+class PresignedVote(object):
+    """A signed transaction that votes for one comment."""
+    def __init__(self, identifier, weight, tx, expiration_time):
+        self.identifier = identifier
+        self.weight = weight
+        self.tx = tx
+        self.expiration_time = expiration_time
+
+class PresignedVotes(object):
+    """Vote transactions that were signed ahead of time."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {identifier: PresignedVote, ...}
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, identifier):
+        return identifier in self.entries
+
+    def put(self, identifier, weight, tx, expiration_time):
+        """Store a signed transaction that votes for identifier with weight."""
+        with self.lock:
+            self.entries[identifier] = PresignedVote(identifier, weight, tx, expiration_time)
+
+    def take(self, identifier, weight, now=None):
+        """Remove and return the signed transaction for a vote.
+
+        Returns None if there is no transaction for identifier, if it votes
+        with a different weight, or if it expires too soon to be broadcast.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            vote = self.entries.pop(identifier, None)
+        if not vote or vote.weight != weight or vote.expiration_time - now < MIN_PRESIGNED_LIFETIME:
+            return None
+        return vote.tx
+
+    def discard(self, identifiers):
+        """Remove the signed transactions for identifiers."""
+        with self.lock:
+            for identifier in identifiers:
+                self.entries.pop(identifier, None)
+
+    def clear(self):
+        """Remove all signed transactions."""
+        with self.lock:
+            self.entries.clear()
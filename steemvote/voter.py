@@ -1,18 +1,89 @@
 from collections import namedtuple
-import datetime
 import logging
 import threading
 import time
 
 import grapheneapi
 
+from steemvote.batch import evaluate_comments
+from steemvote.cache import ContentCache
 from steemvote.config import ConfigError
 from steemvote.db import DB
-from steemvote.models import Priority
+from steemvote.dispatch import VoteDispatcher
+from steemvote.models import make_identifier, parse_time
 from steemvote.rpcnode import SteemvoteSteem
+from steemvote.rules import VotingRules
+from steemvote.scheduler import VoteScheduler
+from steemvote.signing import SigningService
+from steemvote.transactions import DEFAULT_EXPIRATION, STEEMIT_MAX_TIME_UNTIL_EXPIRATION, PresignedVotes
 
 STEEMIT_100_PERCENT = 10000
 STEEMIT_VOTE_REGENERATION_SECONDS = 5*60*60*24 # 5 days
+# Number of full-weight votes that regenerate in a day.
+STEEMIT_VOTE_REGENERATION_PER_DAY = 40
+
+# Interval for resyncing voting power via RPC.
+# Voting power is otherwise kept current from our own votes.
+VOTING_POWER_SYNC_INTERVAL = 10*60 # 10 minutes.
+# Time after which a broadcast vote that has not been seen in a block is forgotten.
+UNCONFIRMED_VOTE_TIMEOUT = 10*60 # 10 minutes.
+
+# Minimum delay before a comment that can't be voted on yet is evaluated again.
+MIN_RESCHEDULE_DELAY = 1 # 1 second.
+# Delay before retrying a comment whose vote could not be broadcast.
+# It doubles with each failed vote.
+VOTE_RETRY_DELAY = 10 # 10 seconds.
+# Number of failed votes after which a comment is no longer tracked.
+MAX_VOTE_ATTEMPTS = 5
+
+class VotingPower(object):
+    """Model of an account's voting power.
+
+    The voting power at any time is computed from the power after the
+    account's last vote and the time of that vote, as the chain does in
+    vote_evaluator::do_apply (https://github.com/steemit/steem/blob/master/libraries/chain/steem_evaluator.cpp).
+    """
+    def __init__(self, voting_power=0, last_vote_time=0):
+        self.lock = threading.Lock()
+        # Voting power after the last vote, out of STEEMIT_100_PERCENT.
+        self.voting_power = voting_power
+        # Time of the last vote.
+        self.last_vote_time = last_vote_time
+
+    def _get_current_power(self, now):
+        elapsed_seconds = max(int(now - self.last_vote_time), 0)
+        regenerated_power = (STEEMIT_100_PERCENT * elapsed_seconds) // STEEMIT_VOTE_REGENERATION_SECONDS
+        return min(self.voting_power + regenerated_power, STEEMIT_100_PERCENT)
+
+    def get(self, now=None):
+        """Get the voting power at now as a decimal."""
+        if now is None:
+            now = time.time()
+        with self.lock:
+            return round(float(self._get_current_power(now)) / STEEMIT_100_PERCENT, 4)
+
+    def set(self, voting_power, last_vote_time):
+        """Set the voting power after the last vote and the time of that vote."""
+        with self.lock:
+            self.voting_power = voting_power
+            self.last_vote_time = last_vote_time
+
+    def apply_vote(self, weight, vote_time):
+        """Use voting power for a vote.
+
+        Args:
+            weight: The vote weight, out of STEEMIT_100_PERCENT.
+            vote_time: The time of the vote.
+        """
+        with self.lock:
+            # A vote older than the last one has already regenerated into the current power.
+            vote_time = max(vote_time, self.last_vote_time)
+            current_power = self._get_current_power(vote_time)
+            used_power = (current_power * abs(weight)) // STEEMIT_100_PERCENT
+            max_vote_denom = STEEMIT_VOTE_REGENERATION_PER_DAY * STEEMIT_VOTE_REGENERATION_SECONDS // (60*60*24)
+            used_power = (used_power + max_vote_denom - 1) // max_vote_denom
+            self.voting_power = max(current_power - used_power, 0)
+            self.last_vote_time = vote_time
 
 ShouldTrack = namedtuple('ShouldTrack', ('track', 'reason',))
 ShouldVote = namedtuple('ShouldVote', ('vote', 'track', 'reason',))
@@ -24,6 +95,10 @@ class Voter(object):
     then calling vote_for_comments() whenever the database
     should be checked for eligible comments.
 
+    Tracked comments are scheduled by when they should next be
+    evaluated, so vote_for_comments() only looks at comments that are
+    due. scheduler.wait() can be used to sleep until one is.
+
     Voting logic is more strict than tracking logic,
     which is just for deciding whether to track a comment.
     Unlike tracking, there is only one should_vote() method.
@@ -32,15 +107,29 @@ class Voter(object):
         self.logger = logging.getLogger(__name__)
         self.config = config
         self.steem = None
-        # Current voting power that we have.
-        self.current_voting_power = 0.0
+        # Model of our voting power.
+        self.voting_power = VotingPower()
         # Interval for updating stats.
-        self.update_interval = 20
+        self.update_interval = VOTING_POWER_SYNC_INTERVAL
         # Last time that stats were updated via RPC.
         self.last_update = 0
-
+        # Votes that have been broadcast but not seen in a block yet.
+        # {identifier: broadcast_time, ...}
+        self.unconfirmed_votes = {}
+        # Numbers of failed votes on tracked comments.
+        # {identifier: failures, ...}
+        self.vote_failures = {}
+        self.vote_failures_lock = threading.Lock()
+
+        # Held while settings are loaded. Readers use self.rules instead.
         self.config_lock = threading.RLock()
         self.voting_lock = threading.Lock()
+        # Tracked comments, scheduled by when they should be evaluated.
+        self.scheduler = VoteScheduler()
+        # Tracked comments, scheduled by when their votes should be signed.
+        self.presign_scheduler = VoteScheduler()
+        # Votes that have been signed ahead of time.
+        self.presigned_votes = PresignedVotes()
 
         # Load settings from config.
 
@@ -54,48 +143,67 @@ class Voter(object):
 
         self.load_settings()
 
+        # Cache of comment content, shared by everything that fetches comments.
+        self.content_cache = ContentCache(config.get('content_cache_size'),
+                config.get_seconds('content_cache_ttl'))
         self.db = DB(config)
+        # Signs vote transactions.
+        self.signer = SigningService(config.get('signing_backend'), config.get('signing_processes'))
+        # Broadcasts the votes that vote_for_comments() decides on.
+        self.dispatcher = VoteDispatcher(self)
 
     def load_settings(self):
         """Load settings from config."""
         with self.config_lock:
             config = self.config
-            # Minimum age of posts to vote for.
-            self.min_post_age = config.get_seconds('min_post_age')
-            # Maximum age of posts to vote for.
-            self.max_post_age = config.get_seconds('max_post_age')
-            if self.min_post_age > self.max_post_age:
-                raise ValueError('Minimum post age cannot be more than maximum post age')
-
-            # Required remaining voting power to vote for each priority of comments.
-            self.priority_voting_powers = priorities = {
-                Priority.low: config.get_decimal('priority_low'),
-                Priority.normal: config.get_decimal('priority_normal'),
-                Priority.high: config.get_decimal('priority_high'),
-            }
-            if not priorities[Priority.low] >= priorities[Priority.normal] >= priorities[Priority.high]:
-                raise ValueError('Priority voting powers must be: low >= normal >= high')
-
-            # Authors to ignore posts by.
-            self.blacklisted_authors = config.get('blacklist_authors')
-            # Categories to ignore posts in.
-            self.blacklisted_categories = config.get('blacklist_categories')
+            # Rules that voting decisions are made with.
+            # Readers take self.rules once, without the lock, and use only that instance.
+            self.rules = VotingRules.from_config(config, self.name)
+
+            # Maximum number of votes to broadcast in one transaction.
+            self.vote_batch_size = config.get('vote_batch_size')
+            if self.vote_batch_size < 1:
+                raise ValueError('Vote batch size must be at least 1')
+
+            # Time before a comment can be voted on to sign the vote for it.
+            self.vote_presign_time = config.get_seconds('vote_presign_time')
+
+            # Evaluate every comment again under the new settings.
+            # Votes are signed again once they are rescheduled.
+            self.presigned_votes.clear()
+            self.scheduler.schedule_all(time.time())
 
             self.rpc_node = config.get('rpc_node')
+            self.rpc_nodes = config.get('rpc_nodes')
+            self.rpc_connections_per_node = config.get('rpc_connections_per_node')
             self.rpc_user = config.get('rpc_user')
             self.rpc_pass = config.get('rpc_pass')
 
-    def connect_to_steem(self):
-        """Connect to a Steem node."""
+    def connect_to_steem(self, start_dispatcher=True):
+        """Connect to a Steem node.
+
+        If start_dispatcher is False, the vote dispatcher is not started,
+        and votes must be broadcast by the caller (as AsyncEngine does).
+        """
         self.logger.debug('Connecting to Steem')
         # We use nobroadcast=True so we can handle exceptions better.
-        self.steem = SteemvoteSteem(node=self.rpc_node, rpcuser=self.rpc_user,
+        nodes = self.rpc_nodes
+        self.steem = SteemvoteSteem(node=nodes[0] if nodes else self.rpc_node, rpcuser=self.rpc_user,
             rpcpassword=self.rpc_pass, wif=self.wif, nobroadcast=True,
-            apis=['database', 'network_broadcast'])
-        self.db.load(self.steem)
+            apis=['database', 'network_broadcast'], rpc_nodes=nodes,
+            connections_per_node=self.rpc_connections_per_node)
+        self.db.load(self.steem, self.content_cache)
+        voter_names = self.get_watched_voters()
+        for comment in self.db.get_tracked_comments(with_metadata=False):
+            comment.index_voters(voter_names)
+            self.schedule_comment(comment)
+        if start_dispatcher:
+            self.dispatcher.start()
         self.logger.debug('Connected')
 
     def close(self):
+        self.dispatcher.stop()
+        self.signer.shutdown()
         self.db.close()
         self.logger.debug('Stopped')
 
@@ -106,56 +214,296 @@ class Voter(object):
         if now - self.last_update < self.update_interval:
             return
 
-        d = self.steem.rpc.get_account(self.name)
+        self.update_from_account(self.steem.rpc.get_account(self.name), now)
+        self.logger.debug('Content cache stats: %s' % self.content_cache.get_stats())
+        self.logger.debug('Vote dispatch stats: %s' % self.dispatcher.get_stats())
+
+    def update_from_account(self, d, now=None):
+        """Update voter stats from the result of get_account()."""
+        if now is None:
+            now = time.time()
         if 'voting_power' not in d.keys():
             msg = 'Invalid get_accounts() response: %s' % d
             self.logger.error(msg)
             raise Exception(msg)
-        # Calculate our current voting power.
-        # From vote_evaluator::do_apply in https://github.com/steemit/steem/blob/master/libraries/chain/steem_evaluator.cpp.
-        last_vote_time = datetime.datetime.strptime(d.get('last_vote_time', "1970-01-01T00:00:00"), '%Y-%m-%dT%H:%M:%S')
-        last_vote_time = last_vote_time.replace(tzinfo=datetime.timezone.utc).timestamp()
-        elapsed_seconds = int(now - last_vote_time)
+        self.voting_power.set(d['voting_power'], parse_time(d.get('last_vote_time', '1970-01-01T00:00:00')))
 
-        regenerated_power = (STEEMIT_100_PERCENT * elapsed_seconds) / STEEMIT_VOTE_REGENERATION_SECONDS
-        current_power = min(d['voting_power'] + regenerated_power, STEEMIT_100_PERCENT)
-        self.current_voting_power = round(float(current_power) / STEEMIT_100_PERCENT, 4)
+        # Forget votes that were broadcast long ago but never seen.
+        with self.voting_power.lock:
+            for identifier, broadcast_time in list(self.unconfirmed_votes.items()):
+                if now - broadcast_time > UNCONFIRMED_VOTE_TIMEOUT:
+                    del self.unconfirmed_votes[identifier]
 
         self.last_update = now
 
+    @property
+    def current_voting_power(self):
+        """Our current voting power as a decimal."""
+        return self.voting_power.get()
+
+    def on_vote_broadcast(self, identifier, weight):
+        """Use voting power for a vote that we broadcast.
+
+        Args:
+            identifier: The identifier of the comment that was voted on.
+            weight: The vote weight as a percentage.
+        """
+        now = time.time()
+        with self.voting_power.lock:
+            self.unconfirmed_votes[identifier] = now
+        self.voting_power.apply_vote(int(weight * STEEMIT_100_PERCENT / 100), now)
+
+    def on_own_vote_op(self, op, block_time):
+        """Update state for a vote operation by our account.
+
+        Voting power is used for the vote unless the vote was broadcast by
+        us, in which case it was used already. A tracked comment that the
+        vote is for is marked as voted on.
+        """
+        identifier = make_identifier(op['author'], op['permlink'])
+        with self.voting_power.lock:
+            broadcast_time = self.unconfirmed_votes.pop(identifier, None)
+        if broadcast_time is None:
+            self.voting_power.apply_vote(op['weight'], block_time)
+
+        tracked_comment = self.db.get_tracked_comment(identifier)
+        if tracked_comment:
+            self.record_voting_results([tracked_comment.comment], [])
+
+    def get_watched_voters(self):
+        """Get the names of the voters whose votes on tracked comments matter.
+
+        These are our delegates and our own account.
+        """
+        return self.rules.watched_voters
+
+    def is_watched_voter(self, name):
+        """Get whether name is in get_watched_voters()."""
+        return name in self.rules.watched_voters
+
+    def get_required_voting_power(self, comment):
+        """Get the lowest voting power at which comment can be voted on.
+
+        Returns None if neither its author nor any delegates that voted
+        for it are known.
+        """
+        rules = self.rules
+        priorities = [i.priority for i in rules.get_voted_delegates(comment)]
+        author = rules.authors.get(comment.author)
+        if author:
+            priorities.append(author.priority)
+        if not priorities:
+            return None
+        return min(rules.priority_voting_powers[i] for i in priorities)
+
+    def _schedule(self, identifier, due_time, presign=True):
+        """Schedule identifier to be evaluated at due_time.
+
+        If presign is True, the vote for identifier is also scheduled to
+        be signed vote_presign_time seconds before due_time.
+        """
+        self.scheduler.schedule(identifier, due_time)
+        if presign and self.vote_presign_time > 0:
+            self.presign_scheduler.schedule(identifier, due_time - self.vote_presign_time)
+
+    def schedule_comment(self, comment):
+        """Schedule comment to be evaluated once it is old enough to vote on."""
+        self._schedule(comment.identifier, comment.timestamp + self.rules.min_post_age)
+
+    def reschedule_comment(self, comment, now):
+        """Schedule comment, which should be tracked but not voted on yet,
+        to be evaluated when it may be possible to vote on it.
+        """
+        rules = self.rules
+        eligible_time = comment.timestamp + rules.min_post_age
+        # Evaluate the comment once it is too old, so that it is dropped.
+        expiration_time = comment.timestamp + rules.max_post_age + 1
+        due_time = expiration_time
+        if now < eligible_time:
+            due_time = eligible_time
+        else:
+            # Wait until our voting power regenerates enough.
+            required_power = self.get_required_voting_power(comment)
+            if required_power is not None:
+                delay = (required_power - self.current_voting_power) * STEEMIT_VOTE_REGENERATION_SECONDS
+                due_time = now + max(delay, MIN_RESCHEDULE_DELAY)
+        # There is no vote to sign if the comment will only be dropped.
+        self._schedule(comment.identifier, min(due_time, expiration_time), presign=due_time < expiration_time)
+
+    def on_watched_vote(self, identifier):
+        """Evaluate a tracked comment again after a watched voter voted on it."""
+        tracked_comment = self.db.get_tracked_comment(identifier)
+        if tracked_comment:
+            self.schedule_comment(tracked_comment.comment)
+
+    def vote_now(self, identifier):
+        """Queue a vote on a tracked comment right away if it should be voted on.
+
+        This is used to follow delegate votes without waiting for the
+        comment to be evaluated by vote_for_comments().
+
+        Returns:
+            Whether a vote was queued.
+        """
+        with self.voting_lock:
+            tracked_comment = self.db.get_tracked_comment(identifier)
+            if not tracked_comment or self.dispatcher.is_pending(identifier):
+                return False
+            comment = tracked_comment.comment
+            if comment.get_have_voted([self.name]) or not self.should_vote(comment).vote:
+                return False
+            weight = self.get_voting_weight(comment)
+            self.scheduler.unschedule([identifier])
+            self.dispatcher.dispatch([(comment, weight)])
+        return True
+
+    def refresh_stale_comments(self, identifiers):
+        """Fetch the content of the stale tracked comments in identifiers.
+
+        Snapshots loaded from the database are stale, and are only
+        refreshed when they are about to be voted on. If they cannot be
+        refreshed, the stale snapshots are used.
+        """
+        stale = []
+        for identifier in identifiers:
+            tracked_comment = self.db.get_tracked_comment(identifier)
+            if tracked_comment and tracked_comment.comment.stale:
+                stale.append(identifier)
+        if not stale:
+            return
+        try:
+            self.db.refresh_comments(self.steem, stale, self.get_watched_voters(), self.content_cache)
+        except Exception as e:
+            self.logger.error('Could not refresh comments: %s' % str(e))
+
+    def expire_comments(self, now=None):
+        """Stop tracking comments that are older than max_post_age."""
+        if now is None:
+            now = time.time()
+        cutoff = now - self.rules.max_post_age
+        identifiers = self.db.expire_comments(cutoff)
+        with self.vote_failures_lock:
+            for identifier in identifiers:
+                self.vote_failures.pop(identifier, None)
+        self.scheduler.unschedule(identifiers)
+        self.presign_scheduler.unschedule(identifiers)
+        self.presigned_votes.discard(identifiers)
+
+    def presign_votes(self, now=None):
+        """Sign the votes for comments that can be voted on soon.
+
+        Each transaction expires DEFAULT_EXPIRATION seconds after the
+        comment is due, so that only the broadcast is left once it is.
+        """
+        if now is None:
+            now = time.time()
+        identifiers = self.presign_scheduler.pop_due(now)
+        if not identifiers:
+            return
+        # [(identifier, weight, expiration), ...]
+        votes = []
+        for identifier in identifiers:
+            tracked_comment = self.db.get_tracked_comment(identifier)
+            due_time = self.scheduler.get_due_time(identifier)
+            if not tracked_comment or due_time is None:
+                continue
+            comment = tracked_comment.comment
+            if not self.should_track(comment).track or comment.get_have_voted([self.name]):
+                continue
+            try:
+                weight = self.get_voting_weight(comment)
+            except Exception:
+                continue
+            expiration = min(int(max(due_time - now, 0)) + DEFAULT_EXPIRATION, STEEMIT_MAX_TIME_UNTIL_EXPIRATION)
+            votes.append((identifier, weight, expiration))
+        if not votes:
+            return
+
+        props = self.steem.rpc.get_dynamic_global_properties()
+        # The transactions are signed together, so that a signing pool signs them in parallel.
+        txs = self.signer.build_vote_transactions(self.name,
+                [([(identifier, weight)], expiration) for identifier, weight, expiration in votes], props, self.wif)
+        for (identifier, weight, expiration), tx in zip(votes, txs):
+            self.presigned_votes.put(identifier, weight, tx, now + expiration)
+            self.logger.debug('Signed vote for %s ahead of time' % identifier)
+
     def get_voting_power(self):
         """Get our current voting power as a string."""
-        return '{voting_power:.{decimals}%}'.format(voting_power=self.current_voting_power,
-                    decimals=len(str(self.current_voting_power)) - 3)
+        voting_power = self.current_voting_power
+        return '{voting_power:.{decimals}%}'.format(voting_power=voting_power,
+                    decimals=len(str(voting_power)) - 3)
+
+    def is_prioritized(self, priority, rules=None, voting_power=None):
+        """Get whether a comment with the given priority should be voted for.
 
-    def is_prioritized(self, priority):
-        """Get whether a comment with the given priority should be voted for."""
-        return self.current_voting_power >= self.priority_voting_powers[priority]
+        If voting_power is None, our current voting power is used.
+        """
+        rules = rules or self.rules
+        if voting_power is None:
+            voting_power = self.current_voting_power
+        return voting_power >= rules.priority_voting_powers[priority]
 
     def get_voting_weight(self, comment):
         """Get the weight that comment should be voted for with."""
-        with self.config_lock:
-            author = self.config.get_author(comment.author)
-            if author:
-                return author.weight
-            delegates = self._get_voted_delegates(comment)
-            if delegates:
-                return max([i.weight for i in delegates])
+        rules = self.rules
+        author = rules.authors.get(comment.author)
+        if author:
+            return author.weight
+        delegates = rules.get_voted_delegates(comment)
+        if delegates:
+            return max([i.weight for i in delegates])
 
         raise Exception('Comment should not be voted for')
 
     def _get_voted_delegates(self, comment):
         """Get the delegates that have voted on comment."""
-        with self.config_lock:
-            my_delegates = {i.name: i for i in self.config.delegates}
-            voted_delegates = comment.get_have_voted(my_delegates.keys())
+        return self.rules.get_voted_delegates(comment)
+
+    def prescreen_comment_op(self, op):
+        """Get whether the comment in a comment operation could be tracked.
+
+        Only the operation's payload is checked, so that comments which
+        cannot be tracked are rejected before their content is fetched.
+
+        Returns:
+            A ShouldTrack instance.
+        """
+        rules = self.rules
+        # Check if the post is by a blacklisted author.
+        if op['author'] in rules.blacklisted_authors:
+            return ShouldTrack(False, 'comment is by a blacklisted author')
+        # Check if the author isn't known to steemvote.
+        author = rules.authors.get(op['author'])
+        if not author:
+            return ShouldTrack(False, 'author is unknown')
+        if op['parent_author']:
+            # Check if we omit replies by the author.
+            if not author.vote_replies:
+                return ShouldTrack(False, 'comment is a reply')
+        # The parent permlink of a top-level post is its category.
+        elif op['parent_permlink'] in rules.blacklisted_categories:
+            return ShouldTrack(False, 'comment is in a blacklisted category')
+        return ShouldTrack(True, '')
 
-        result = []
-        for delegate_name in voted_delegates:
-            result.append(my_delegates[delegate_name])
-        return result
+    def prescreen_vote_op(self, op):
+        """Get whether the comment in a vote operation could be tracked.
+
+        Only the operation's payload is checked, so that comments which
+        cannot be tracked are rejected before their content is fetched.
+
+        Returns:
+            A ShouldTrack instance.
+        """
+        rules = self.rules
+        # Check if the voter isn't a delegate.
+        if op['voter'] not in rules.delegates:
+            return ShouldTrack(False, 'voter is not a delegate')
+        # Check if the post is by a blacklisted author.
+        if op['author'] in rules.blacklisted_authors:
+            return ShouldTrack(False, 'comment is by a blacklisted author')
+        return ShouldTrack(True, '')
 
-    def should_track(self, comment):
+    def should_track(self, comment, rules=None, now=None):
         """Get whether comment should be tracked.
 
         This is a less-strict form of should_vote().
@@ -163,143 +511,330 @@ class Voter(object):
         Returns:
             A ShouldTrack instance.
         """
+        rules = rules or self.rules
+        if now is None:
+            now = time.time()
         # Check if the comment has curation disabled.
         if not comment.allow_curation_rewards or not comment.allow_votes:
             return ShouldTrack(False, 'comment does not allow curation')
-        with self.config_lock:
-            # Check if the post is by a blacklisted author.
-            if comment.author in self.blacklisted_authors:
-                return ShouldTrack(False, 'comment is by a blacklisted author')
-            # Check if the post is in a blacklisted category.
-            if comment.category in self.blacklisted_categories:
-                return ShouldTrack(False, 'comment is in a blacklisted category')
-            # Check if the post is too old.
-            if time.time() - comment.timestamp > self.max_post_age:
-                return ShouldTrack(False, 'comment is too old')
+        # Check if the post is by a blacklisted author.
+        if comment.author in rules.blacklisted_authors:
+            return ShouldTrack(False, 'comment is by a blacklisted author')
+        # Check if the post is in a blacklisted category.
+        if comment.category in rules.blacklisted_categories:
+            return ShouldTrack(False, 'comment is in a blacklisted category')
+        # Check if the post is too old.
+        if now - comment.timestamp > rules.max_post_age:
+            return ShouldTrack(False, 'comment is too old')
         return ShouldTrack(True, '')
 
     def should_track_for_author(self, comment):
         """Get whether comment should be tracked, based on its author."""
+        rules = self.rules
         # First check against the less-strict should_track() rules.
-        should_track = self.should_track(comment)
+        should_track = self.should_track(comment, rules)
         if not should_track.track:
             return should_track
-        with self.config_lock:
-            # Check if the author isn't known to steemvote.
-            author = self.config.get_author(comment.author)
-            if not author:
-                return ShouldTrack(False, 'author is unknown')
-            # Check if we omit replies by the author.
-            if comment.is_reply() and not author.vote_replies:
-                return ShouldTrack(False, 'comment is a reply')
+        # Check if the author isn't known to steemvote.
+        author = rules.authors.get(comment.author)
+        if not author:
+            return ShouldTrack(False, 'author is unknown')
+        # Check if we omit replies by the author.
+        if comment.is_reply() and not author.vote_replies:
+            return ShouldTrack(False, 'comment is a reply')
         return ShouldTrack(True, '')
 
     def should_track_for_delegate(self, comment):
         """Get whether comment should be tracked, based on delegate votes."""
+        rules = self.rules
         # First check against the less-strict should_track() rules.
-        should_track = self.should_track(comment)
+        should_track = self.should_track(comment, rules)
         if not should_track.track:
             return should_track
-        with self.config_lock:
-            if not self._get_voted_delegates(comment):
-                return ShouldTrack(False, 'no delegates have voted for comment')
+        if not rules.get_voted_delegates(comment):
+            return ShouldTrack(False, 'no delegates have voted for comment')
         return ShouldTrack(True, '')
 
-    def _should_vote_author(self, comment):
+    def _should_vote_author(self, comment, rules, voting_power):
         """Get whether comment should be voted on, based on its author.
 
         Returns:
             A 2-tuple of (should_vote, reason).
         """
-        with self.config_lock:
-            # Check if the priority is high enough given our voting power.
-            author = self.config.get_author(comment.author)
-            if not author or not self.is_prioritized(author.priority):
-                return (False, 'author does not have a high enough priority')
+        # Check if the priority is high enough given our voting power.
+        author = rules.authors.get(comment.author)
+        if not author or not self.is_prioritized(author.priority, rules, voting_power):
+            return (False, 'author does not have a high enough priority')
         return (True, '')
 
-    def _should_vote_delegates(self, comment):
+    def _should_vote_delegates(self, comment, rules, voting_power):
         """Get whether comment should be voted on, based on delegate votes.
 
         Returns:
             A 2-tuple of (should_vote, reason).
         """
-        with self.config_lock:
-            delegates = self._get_voted_delegates(comment)
-            if not delegates:
-                return (False, 'no delegates have voted for comment')
-            if not any(self.is_prioritized(priority) for priority in [i.priority for i in delegates]):
-                return (False, 'no delegates with a high enough priority')
+        delegates = rules.get_voted_delegates(comment)
+        if not delegates:
+            return (False, 'no delegates have voted for comment')
+        if not any(self.is_prioritized(priority, rules, voting_power) for priority in [i.priority for i in delegates]):
+            return (False, 'no delegates with a high enough priority')
 
         return (True, '')
 
-    def should_vote(self, comment):
-        """Get whether comment should be voted on.
+    def should_vote(self, comment, now=None):
+        """Get whether comment should be voted on at now.
 
         Calls _should_vote_author() and should_vote_delegate().
         The result is False if both are False.
 
+        Every check is made with the same rules, even if the settings
+        change while they are made.
+
         Returns:
             A ShouldVote instance.
         """
+        rules = self.rules
+        if now is None:
+            now = time.time()
         # First check against the less-strict should_track() rules.
-        should_track = self.should_track(comment)
+        should_track = self.should_track(comment, rules, now)
         if not should_track.track:
             return ShouldVote(False, *should_track)
         # Then check against rules that depend on context.
-        with self.config_lock:
-            # Check if the comment is too young.
-            if time.time() - comment.timestamp < self.min_post_age:
-                return ShouldVote(False, True, 'comment is too young')
-            # Check if the comment should be voted on based on its author
-            # or any delegates that have voted for it.
-            should_vote_author = self._should_vote_author(comment)
-            should_vote_delegates = self._should_vote_delegates(comment)
-            if not should_vote_author[0] and not should_vote_delegates[0]:
-                return ShouldVote(False, True, ' and '.join([should_vote_author[1], should_vote_delegates[1]]))
+        # Check if the comment is too young.
+        if now - comment.timestamp < rules.min_post_age:
+            return ShouldVote(False, True, 'comment is too young')
+        # Check if the comment should be voted on based on its author
+        # or any delegates that have voted for it.
+        voting_power = self.voting_power.get(now)
+        should_vote_author = self._should_vote_author(comment, rules, voting_power)
+        should_vote_delegates = self._should_vote_delegates(comment, rules, voting_power)
+        if not should_vote_author[0] and not should_vote_delegates[0]:
+            return ShouldVote(False, True, ' and '.join([should_vote_author[1], should_vote_delegates[1]]))
         return ShouldVote(True, True, '')
 
-    def _vote(self, identifier, weight):
-        """Create and broadcast a vote for identifier."""
-        tx = self.steem.vote(identifier, weight, voter=self.name)
-        try:
-            self.steem.rpc.broadcast_transaction(tx, api='network_broadcast')
-            self.logger.info('Voted on %s' % identifier)
-        except grapheneapi.graphenewsrpc.RPCError as e:
-            already_voted_messages = [
-                'Changing your vote requires',
-                'Cannot vote again',
-            ]
-            if e.args and any(i in e.args[0] for i in already_voted_messages):
-                self.logger.info('Skipping already-voted post %s' % identifier)
-            else:
-                raise e
+    def is_already_voted_error(self, e):
+        """Get whether the RPCError e means that a comment has already been voted on."""
+        already_voted_messages = [
+            'Changing your vote requires',
+            'Cannot vote again',
+        ]
+        return bool(e.args and any(i in e.args[0] for i in already_voted_messages))
 
-    def vote_for_comments(self):
-        """Vote on the comments that are ready."""
-        if not self.steem:
-            raise Exception('Not connected to a Steem node')
+    def get_vote_batches(self, votes):
+        """Split votes into batches of at most vote_batch_size votes."""
+        size = self.vote_batch_size
+        return [votes[i:i + size] for i in range(0, len(votes), size)]
+
+    def take_presigned_transaction(self, votes):
+        """Get the transaction for votes if it was signed ahead of time.
+
+        Returns:
+            The signed transaction, or None.
+        """
+        if len(votes) == 1:
+            return self.presigned_votes.take(*votes[0])
+        return None
+
+    def _vote(self, votes):
+        """Create and broadcast one transaction that votes for comments.
 
-        # Comments that have been voted on.
-        voted_comments = []
+        Args:
+            votes: A list of (identifier, weight) 2-tuples.
+        """
+        tx = self.take_presigned_transaction(votes)
+        if tx is None:
+            props = self.steem.rpc.get_dynamic_global_properties()
+            tx = self.signer.build_vote_transaction(self.name, votes, props, self.wif)
+        self.steem.rpc.broadcast_transaction(tx, api='network_broadcast')
+
+    def split_vote_batch(self, votes):
+        """Generate the transactions that vote for comments.
+
+        This is the batching logic shared by vote_batch() and
+        AsyncEngine.vote_batch(). Each list of votes to broadcast in one
+        transaction is yielded, and the RPCError that the transaction was
+        rejected with, or None if it was broadcast, is sent back.
+
+        If a transaction is rejected, its votes are split in half and
+        yielded again, so that one rejected vote does not prevent the others.
+
+        Args:
+            votes: A list of (identifier, weight) 2-tuples.
+
+        Returns:
+            The same as vote_batch().
+        """
+        error = yield votes
+        if error is None:
+            for identifier, weight in votes:
+                self.on_vote_broadcast(identifier, weight)
+                self.logger.info('Voted on %s' % identifier)
+            return ([i[0] for i in votes], [])
+
+        if len(votes) > 1:
+            middle = len(votes) // 2
+            first_voted, first_failed = yield from self.split_vote_batch(votes[:middle])
+            second_voted, second_failed = yield from self.split_vote_batch(votes[middle:])
+            return (first_voted + second_voted, first_failed + second_failed)
+
+        identifier = votes[0][0]
+        if self.is_already_voted_error(error):
+            self.logger.info('Skipping already-voted post %s' % identifier)
+            return ([identifier], [])
+        self.logger.error('Could not vote on %s: %s' % (identifier, str(error)))
+        return ([], [identifier])
+
+    def vote_batch(self, votes, wait_for_slot=None):
+        """Vote for comments with as few transactions as possible.
+
+        The transactions are worked out by split_vote_batch().
+
+        Args:
+            votes: A list of (identifier, weight) 2-tuples.
+            wait_for_slot: A function that is called before each
+                transaction is broadcast, such as
+                VoteDispatcher.wait_for_broadcast_slot().
+
+        Returns:
+            A 2-tuple of ([identifier, ...], [identifier, ...]).
+            The first item contains the comments that have been voted for,
+            and the second contains the comments whose votes were rejected.
+        """
+        transactions = self.split_vote_batch(votes)
+        votes = next(transactions)
+        while True:
+            if wait_for_slot:
+                wait_for_slot()
+            try:
+                self._vote(votes)
+                error = None
+            except grapheneapi.graphenewsrpc.RPCError as e:
+                error = e
+            try:
+                votes = transactions.send(error)
+            except StopIteration as e:
+                return e.value
+
+    def pop_due_comments(self, now):
+        """Pop the identifiers of the tracked comments that are due at now.
+
+        Comments older than max_post_age are expired first. Stale comments
+        are refreshed, which makes RPC calls, so this should not be called
+        with voting_lock held.
+        """
+        self.expire_comments(now)
+        due_identifiers = self.scheduler.pop_due(now)
+        self.refresh_stale_comments(due_identifiers)
+        return due_identifiers
+
+    def get_comments_to_vote(self):
+        """Sort the tracked comments that are due by what should be done with them.
+
+        This calls pop_due_comments() and then sort_due_comments().
+        """
+        now = time.time()
+        return self.sort_due_comments(self.pop_due_comments(now), now)
+
+    def sort_due_comments(self, due_identifiers, now):
+        """Sort the tracked comments in due_identifiers by what should be done with them.
+
+        Comments that should stay tracked are scheduled again.
+
+        Returns:
+            A 3-tuple of ([(comment, weight), ...], [comment, ...], [identifier, ...]).
+            The first item contains the comments to vote for, the second
+            contains the comments that we have already voted for, and the
+            third contains the comments that should no longer be tracked.
+        """
+        # Comments that should be voted on.
+        votes = []
+        # Comments that we have already voted on.
+        already_voted = []
         # Identifiers of comments that should no longer be tracked.
         old_identifiers = []
 
-        with self.voting_lock:
-            comments = self.db.get_tracked_comments(with_metadata=False)
-            for comment in comments:
-                # Skip if the comment shouldn't be voted on now.
-                should_vote = self.should_vote(comment)
-                if not should_vote.vote:
-                    # Check whether to stop tracking the comment.
-                    if not should_vote.track:
-                        old_identifiers.append(comment.identifier)
-                        self.logger.debug('Stop tracking %s because %s' % (comment.identifier, should_vote.reason))
-                # Vote for the comment.
+        # Comments to evaluate.
+        comments = []
+        for identifier in due_identifiers:
+            tracked_comment = self.db.get_tracked_comment(identifier)
+            if not tracked_comment:
+                continue
+            # The dispatcher reports on comments that it is voting on.
+            if self.dispatcher.is_pending(identifier):
+                continue
+            comment = tracked_comment.comment
+            if comment.get_have_voted([self.name]):
+                already_voted.append(comment)
+                continue
+            comments.append(comment)
+
+        log_reasons = self.logger.isEnabledFor(logging.DEBUG)
+        for comment, should_vote, should_track in zip(comments, *evaluate_comments(self, comments, now)):
+            # Skip if the comment shouldn't be voted on now.
+            if not should_vote:
+                # Check whether to stop tracking the comment.
+                if not should_track:
+                    old_identifiers.append(comment.identifier)
+                    # Reasons are only worked out for the comments that are logged.
+                    if log_reasons:
+                        reason = self.should_vote(comment, now).reason
+                        self.logger.debug('Stop tracking %s because %s' % (comment.identifier, reason))
                 else:
-                    weight = self.get_voting_weight(comment)
-                    self._vote(comment.identifier, weight)
-                    voted_comments.append(comment)
+                    self.reschedule_comment(comment, now)
+            else:
+                votes.append((comment, self.get_voting_weight(comment)))
+        return (votes, already_voted, old_identifiers)
+
+    def record_voting_results(self, voted_comments, old_identifiers, failed_comments=()):
+        """Update the database and schedule after a round of voting.
+
+        failed_comments are comments whose votes could not be broadcast.
+        They are retried after VOTE_RETRY_DELAY seconds, which doubles
+        with each failure, and are no longer tracked after
+        MAX_VOTE_ATTEMPTS failures.
+        """
+        old_identifiers = list(old_identifiers)
+        now = time.time()
+        # [(identifier, retry_time), ...]
+        retries = []
+        with self.vote_failures_lock:
+            for identifier in [i.identifier for i in voted_comments] + old_identifiers:
+                self.vote_failures.pop(identifier, None)
+            for comment in failed_comments:
+                failures = self.vote_failures.get(comment.identifier, 0) + 1
+                if failures >= MAX_VOTE_ATTEMPTS:
+                    self.logger.error('Giving up on %s after %d failed votes' % (comment.identifier, failures))
+                    self.vote_failures.pop(comment.identifier, None)
+                    old_identifiers.append(comment.identifier)
+                    continue
+                self.vote_failures[comment.identifier] = failures
+                retries.append((comment.identifier, now + VOTE_RETRY_DELAY * 2 ** (failures - 1)))
+
+        self.db.update_voted_comments(voted_comments)
+        self.db.remove_tracked_comments(old_identifiers)
+        identifiers = [i.identifier for i in voted_comments] + old_identifiers
+        self.scheduler.unschedule(identifiers)
+        self.presign_scheduler.unschedule(identifiers)
+        self.presigned_votes.discard(identifiers)
+        for identifier, retry_time in retries:
+            self.scheduler.schedule(identifier, retry_time)
+
+    def vote_for_comments(self):
+        """Queue votes on the comments that are ready.
 
-            self.db.update_voted_comments(voted_comments)
-            self.db.remove_tracked_comments(old_identifiers)
+        The votes are broadcast by the dispatcher, which records
+        their outcomes. Votes for comments that will be ready soon
+        are then signed ahead of time.
+        """
+        if not self.steem:
+            raise Exception('Not connected to a Steem node')
+
+        now = time.time()
+        # Refreshing comments makes RPC calls, so vote_now() is not held up by it.
+        due_identifiers = self.pop_due_comments(now)
+        with self.voting_lock:
+            votes, voted_comments, old_identifiers = self.sort_due_comments(due_identifiers, now)
+            self.record_voting_results(voted_comments, old_identifiers)
+            self.dispatcher.dispatch(votes)
+        self.presign_votes()
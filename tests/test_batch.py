@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from steemvote import batch
+from steemvote.config import Config
+from steemvote.models import Author, CommentSnapshot, Delegate, Priority
+from steemvote.voter import Voter
+
+NOW = 1000000
+
+@pytest.fixture
+def voter(tmpdir):
+    config = Config(no_saving=True)
+    config.set('voter_account_name', 'me')
+    config.set('vote_key', '5K')
+    config.set('database_path', str(tmpdir.join('test.db')))
+    config.set('blacklist_authors', ['spammer'])
+    config.set_authors([Author('alice', priority=Priority.high), Author('bob', priority=Priority.low),
+            Author('spammer')], save=False)
+    config.set_delegates([Delegate('carol', priority=Priority.normal), Delegate('dave', priority=Priority.low)],
+            save=False)
+    voter = Voter(config)
+    yield voter
+    voter.close()
+
+def random_comments(count, seed=0):
+    rng = random.Random(seed)
+    comments = []
+    for i in range(count):
+        voters = [name for name in ['carol', 'dave', 'erin'] if rng.random() < 0.3]
+        comments.append(CommentSnapshot(rng.choice(['alice', 'bob', 'spammer', 'frank']), 'post-%d' % i,
+                rng.choice(['steem', 'spam', 'life']), '', NOW - rng.randint(0, 3 * 24 * 60 * 60),
+                allow_curation_rewards=rng.random() < 0.9, relevant_voters=voters))
+    return comments
+
+def test_small_batches_are_evaluated_each(voter):
+    comments = random_comments(10)
+    should_vote, should_track = batch.evaluate_comments(voter, comments, NOW)
+    assert should_vote == [voter.should_vote(i, NOW).vote for i in comments]
+    assert should_track == [voter.should_vote(i, NOW).track for i in comments]
+
+def track(voter, comments):
+    for comment in comments:
+        voter.db.add_comment(comment, 'author', comment.author)
+
+@pytest.mark.parametrize('voting_power', [10000, 9200, 8500, 5000])
+def test_vectorized_matches_each(voter, voting_power):
+    pytest.importorskip('numpy')
+    voter.voting_power.set(voting_power, NOW)
+    comments = random_comments(2000)
+    track(voter, comments)
+    assert batch.evaluate_vectorized(voter, comments, NOW) == batch.evaluate_each(voter, comments, NOW)
+
+def test_columns_follow_changes(voter):
+    pytest.importorskip('numpy')
+    voter.voting_power.set(9200, NOW)
+    comments = random_comments(2000)
+    track(voter, comments)
+    assert batch.evaluate_vectorized(voter, comments, NOW) == batch.evaluate_each(voter, comments, NOW)
+
+    # Votes by watched voters, removed comments and new rules are reflected.
+    for comment in comments[:500]:
+        voter.db.record_vote(comment.identifier, 'carol')
+    voter.db.remove_tracked_comments([i.identifier for i in comments[500:1000]])
+    voter.config.set_delegates([Delegate('carol', priority=Priority.high)], save=False)
+    voter.config.set('blacklist_categories', ['life'])
+    voter.load_settings()
+    # The database's snapshots have the recorded votes.
+    remaining = [voter.db.get_tracked_comment(i.identifier).comment for i in comments[:500] + comments[1000:]]
+    assert batch.evaluate_vectorized(voter, remaining, NOW) == batch.evaluate_each(voter, remaining, NOW)
+    assert batch.evaluate_vectorized(voter, comments, NOW) is None
+
+    # Freed rows are reused and the columns grow as needed.
+    more = random_comments(3000, seed=1)
+    for i, comment in enumerate(more):
+        comment.identifier = '@%s/more-%d' % (comment.author, i)
+    track(voter, more)
+    assert len(voter.db.columns) == 1500 + 3000
+    assert batch.evaluate_vectorized(voter, more, NOW) == batch.evaluate_each(voter, more, NOW)
@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+
+import pytest
+
+from steemvote.blocks import BlockFetcher, BlockWindow
+
+class FakeRPC(object):
+    """RPC that serves blocks with random latency."""
+    def __init__(self, head):
+        self.head = head
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_dynamic_global_properties(self):
+        return {'head_block_number': self.head, 'last_irreversible_block_num': self.head}
+
+    def get_block(self, num):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.in_flight, self.max_in_flight)
+        time.sleep(random.random() * 0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if num > self.head:
+            return None
+        return {'block_num': num, 'transactions': []}
+
+def take(iterator, count):
+    return [next(iterator) for _ in range(count)]
+
+def test_blocks_in_order():
+    rpc = FakeRPC(head=100)
+    fetcher = BlockFetcher(rpc, window=8)
+    blocks = take(fetcher.stream(start=1), 100)
+    assert [num for num, _ in blocks] == list(range(1, 101))
+    assert all(block['block_num'] == num for num, block in blocks)
+    assert 1 < rpc.max_in_flight <= 8
+
+def test_single_request_at_head():
+    rpc = FakeRPC(head=10)
+    fetcher = BlockFetcher(rpc, window=8)
+    fetcher.block_interval = 0.01
+    iterator = fetcher.stream()
+    assert take(iterator, 1)[0][0] == 10
+
+    rpc.max_in_flight = 0
+    rpc.head = 11
+    assert take(iterator, 1)[0][0] == 11
+    assert rpc.max_in_flight == 1
+
+def test_invalid_window():
+    with pytest.raises(ValueError):
+        BlockFetcher(FakeRPC(head=1), window=0)
+
+def test_catch_up_hands_off_to_live_blocks():
+    rpc = FakeRPC(head=50)
+    fetcher = BlockFetcher(rpc, window=8)
+    fetcher.block_interval = 0.01
+    iterator = fetcher.stream(start=1)
+    caught_up = take(iterator, 50)
+
+    rpc.head = 53
+    live = take(iterator, 3)
+    assert [num for num, _ in caught_up + live] == list(range(1, 54))
+
+def test_window():
+    window = BlockWindow(1, 5, 3)
+    requested = []
+    request = lambda num: requested.append(num) or num
+    window.fill(request)
+    assert requested == [1, 2, 3]
+    assert window.pop() == (1, 1)
+    window.retry(1, request)
+    window.fill(request)
+    assert requested == [1, 2, 3, 1]
+    assert [window.pop() for _ in range(3)] == [(1, 1), (2, 2), (3, 3)]
+    window.fill(request)
+    window.fill(request)
+    assert requested[-2:] == [4, 5]
+    assert len(window) == 2
+    assert not window.update_head(5)
+    assert window.update_head(6)
@@ -0,0 +1,68 @@
+import time
+
+from steemvote.cache import ContentCache
+from steemvote.models import hydrate_comments
+
+def content(author, permlink, voters=()):
+    return {
+        'author': author,
+        'permlink': permlink,
+        'active_votes': [{'voter': i, 'percent': 10000} for i in voters],
+    }
+
+def test_lru_eviction():
+    cache = ContentCache(max_size=2, ttl=60)
+    cache.put('@a/1', content('a', '1'))
+    cache.put('@a/2', content('a', '2'))
+    # Use the first entry so that the second is least recently used.
+    assert cache.get('@a/1')
+    cache.put('@a/3', content('a', '3'))
+
+    assert cache.get('@a/2') is None
+    assert cache.get('@a/1') and cache.get('@a/3')
+    assert cache.get_stats() == {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1}
+
+def test_ttl():
+    cache = ContentCache(max_size=10, ttl=0.01)
+    cache.put('@a/1', content('a', '1'))
+    time.sleep(0.02)
+    assert cache.get('@a/1') is None
+    assert len(cache) == 0
+
+def test_stream_updates():
+    cache = ContentCache()
+    original = content('a', '1', voters=['bob'])
+    cache.put('@a/1', original)
+
+    cache.on_vote_op({'voter': 'carol', 'author': 'a', 'permlink': '1', 'weight': 5000})
+    assert [i['voter'] for i in cache.get('@a/1')['active_votes']] == ['bob', 'carol']
+    # Content that was handed out is not modified.
+    assert [i['voter'] for i in original['active_votes']] == ['bob']
+
+    cache.on_comment_op({'author': 'a', 'permlink': '1', 'parent_author': '', 'parent_permlink': 'test'})
+    assert cache.get('@a/1') is None
+
+class FakeRPC(object):
+    def __init__(self):
+        self.calls = 0
+
+    def get_contents(self, pairs):
+        self.calls += 1
+        return [dict(content(author, permlink), created='2016-08-01T00:00:00', category='test', parent_author='')
+                for author, permlink in pairs]
+
+class FakeSteem(object):
+    def __init__(self):
+        self.rpc = FakeRPC()
+
+def test_hydrate_comments_uses_cache():
+    steem = FakeSteem()
+    cache = ContentCache()
+    comments = hydrate_comments(steem, ['@a/1'], cache)
+    assert list(comments.keys()) == ['@a/1']
+    assert steem.rpc.calls == 1
+    assert len(cache) == 1
+
+    comments = hydrate_comments(steem, ['@a/1'], cache)
+    assert comments['@a/1'].author == 'a'
+    assert steem.rpc.calls == 1
@@ -1,7 +1,7 @@
 import pytest
 
 from steemvote.config import Config, default_values, get_decimal
-from steemvote.models import Priority
+from steemvote.models import Delegate, Priority
 
 class TestDecimal(object):
     def test_float(self):
@@ -48,3 +48,16 @@ def test_update_keys(old_keys_dict):
 
     for old_option in old_keys_dict.keys():
         assert c.get(old_option) is None
+
+def test_user_indexes():
+    """Test that authors and delegates are looked up by name."""
+    c = Config(no_saving=True)
+    c.options = {'authors': ['alice', {'name': 'bob', 'priority': 'high'}], 'delegates': ['carol']}
+    c.options_loaded()
+    assert c.get_author('bob').priority == Priority.high
+    assert c.get_author('carol') is None
+    assert c.get_delegate('carol').name == 'carol'
+
+    c.set_delegates([Delegate('dave')])
+    assert c.get_delegate('carol') is None
+    assert c.get_delegate('dave').name == 'dave'
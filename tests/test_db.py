@@ -0,0 +1,151 @@
+import sqlite3
+import time
+
+import pytest
+
+from steemvote.db import DB, DBComment
+from steemvote.migrations import parse_version
+
+class FakeConfig(object):
+    def __init__(self, path):
+        self.path = path
+
+    def get(self, key, value=None):
+        if key == 'database_path':
+            return self.path
+        if key == 'max_post_age':
+            return 2 * 24 * 60 * 60
+        return value
+
+    def get_seconds(self, key, value=None):
+        return self.get(key, value)
+
+class FakeComment(object):
+    def __init__(self, identifier, timestamp):
+        self.identifier = identifier
+        self.timestamp = timestamp
+        self.author, self.permlink = identifier[1:].split('/')
+        self.category = 'steem'
+        self.parent_author = ''
+        self.allow_votes = True
+        self.allow_curation_rewards = True
+        self.relevant_voters = set()
+
+@pytest.fixture
+def db(tmpdir):
+    db = DB(FakeConfig(str(tmpdir.join('test.db'))))
+    yield db
+    db.close()
+
+def test_expire_comments(db):
+    for i in range(5):
+        db.add_comment_with_author(FakeComment('@alice/post-%d' % i, 1000 * i))
+
+    assert sorted(db.expire_comments(2500)) == ['@alice/post-0', '@alice/post-1', '@alice/post-2']
+    assert sorted(db.tracked_comments.keys()) == ['@alice/post-3', '@alice/post-4']
+    db.flush()
+    assert DBComment.select().count() == 2
+
+def test_voted_comments_are_not_expired(db):
+    comment = FakeComment('@alice/post', 1000)
+    db.add_comment_with_author(comment)
+    db.update_voted_comments([comment])
+    assert db.expire_comments(5000) == []
+    db.flush()
+    assert DBComment.select().where(DBComment.status == 'voted').count() == 1
+
+def test_group_commit(db):
+    comments = [FakeComment('@alice/post-%d' % i, 1000) for i in range(1000)]
+    for comment in comments:
+        assert db.add_comment_with_author(comment)
+    # Comments with pending writes are not added again.
+    assert not db.add_comment_with_author(comments[0])
+    db.set_last_block(42)
+    assert db.get_last_block() == 42
+
+    db.update_voted_comments(comments[:500])
+    db.remove_tracked_comments([i.identifier for i in comments[500:600]])
+    db.flush()
+    assert DBComment.select().where(DBComment.status == 'voted').count() == 500
+    assert DBComment.select().where(DBComment.status == 'tracked').count() == 400
+    assert db.get_last_block() == 42
+
+    # Voted comments are not added again.
+    db.forget_comments([comments[0].identifier])
+    assert not db.add_comment_with_author(comments[0])
+
+def test_voted_comments_are_not_tracked_again(tmpdir, monkeypatch):
+    path = str(tmpdir.join('test.db'))
+    now = time.time()
+    db = DB(FakeConfig(path))
+    comment = FakeComment('@alice/post', now - 1000)
+    old_comment = FakeComment('@alice/old', now - 3 * 24 * 60 * 60)
+    db.add_comment_with_author(comment)
+    db.add_comment_with_author(old_comment)
+    db.update_voted_comments([comment, old_comment])
+    db.close()
+
+    db = DB(FakeConfig(path))
+    # Only comments younger than max_post_age are loaded.
+    assert comment.identifier in db.untracked_comments
+    assert old_comment.identifier not in db.untracked_comments
+    # Adding comments does not query the database.
+    monkeypatch.setattr(DBComment, 'select', None)
+    assert not db.add_comment_with_author(comment)
+    assert db.add_comment_with_author(FakeComment('@alice/other', now))
+
+    # Untracked comments are forgotten once they are too old to be tracked.
+    db.expire_comments(now)
+    assert len(db.untracked_comments) == 0
+    db.close()
+
+def test_parse_version():
+    assert parse_version('0.10.0') > parse_version('0.9.1')
+
+def test_migrate_from_0_1_0(tmpdir):
+    path = str(tmpdir.join('old.db'))
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE dbconfig (id INTEGER PRIMARY KEY, key VARCHAR(255) NOT NULL, value VARCHAR(255) NOT NULL);
+        CREATE TABLE dbcomment (id INTEGER PRIMARY KEY, identifier VARCHAR(255) NOT NULL,
+            reason_type VARCHAR(255) NOT NULL, reason_value VARCHAR(255) NOT NULL,
+            tracked INTEGER NOT NULL, voted INTEGER NOT NULL);
+        CREATE UNIQUE INDEX dbcomment_identifier ON dbcomment (identifier);
+        INSERT INTO dbconfig (key, value) VALUES ('db_version', '0.1.0');
+        INSERT INTO dbcomment (identifier, reason_type, reason_value, tracked, voted) VALUES
+            ('@alice/a', 'author', 'alice', 1, 0), ('@alice/b', 'author', 'alice', 0, 1);
+    """)
+    conn.commit()
+    conn.close()
+
+    db = DB(FakeConfig(path))
+    try:
+        assert db.get_version() == DB.db_version
+        assert {c.identifier: c.status for c in DBComment.select()} == {'@alice/a': 'tracked', '@alice/b': 'voted'}
+        indexes = [i[0] for i in db.db.execute_sql("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()]
+        assert 'dbcomment_status_created' in indexes
+        assert 'dbcomment_tracked_voted' not in indexes
+        columns = [i[1] for i in db.db.execute_sql('PRAGMA table_info(dbcomment)').fetchall()]
+        assert 'tracked' not in columns and 'voted' not in columns
+        assert db.db.execute_sql('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    finally:
+        db.close()
+
+def test_load_snapshots(tmpdir):
+    config = FakeConfig(str(tmpdir.join('test.db')))
+    db = DB(config)
+    comment = FakeComment('@alice/post', 1000)
+    db.add_comment_with_author(comment)
+    db.record_vote(comment.identifier, 'bob')
+    db.close()
+
+    db = DB(config)
+    try:
+        # No RPC is needed to load comments with snapshots.
+        db.load(None)
+        snapshot = db.get_tracked_comment(comment.identifier).comment
+        assert snapshot.timestamp == 1000
+        assert snapshot.get_have_voted(['bob', 'carol']) == ['bob']
+        assert snapshot.stale
+    finally:
+        db.close()
@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from steemvote import dispatch
+from steemvote.dispatch import VoteDispatcher
+
+class FakeComment(object):
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+class FakeVoter(object):
+    """Voter whose broadcasts fail a given number of times."""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.broadcast_times = []
+        self.voted = []
+        self.failed = []
+
+    def get_vote_batches(self, votes):
+        return [[i] for i in votes]
+
+    def vote_batch(self, votes, wait_for_slot=None):
+        wait_for_slot()
+        if self.failures:
+            self.failures -= 1
+            raise Exception('Connection lost')
+        self.broadcast_times.append(time.time())
+        return ([i[0] for i in votes], [])
+
+    def record_voting_results(self, voted_comments, old_identifiers, failed_comments=()):
+        self.voted.extend(i.identifier for i in voted_comments)
+        self.failed.extend(i.identifier for i in failed_comments)
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(dispatch, 'DISPATCH_RETRY_DELAY', 0)
+
+def wait_for(condition, timeout=5):
+    started = time.time()
+    while not condition() and time.time() - started < timeout:
+        time.sleep(0.01)
+
+def test_respects_min_interval():
+    voter = FakeVoter()
+    dispatcher = VoteDispatcher(voter, num_workers=3, min_interval=0.1)
+    dispatcher.start()
+    dispatcher.dispatch([(FakeComment('@alice/%d' % i), 100.0) for i in range(4)])
+    # Queued comments are not queued again.
+    dispatcher.dispatch([(FakeComment('@alice/0'), 100.0)])
+    wait_for(lambda: len(voter.voted) == 4)
+    dispatcher.stop()
+
+    assert sorted(voter.voted) == ['@alice/%d' % i for i in range(4)]
+    times = sorted(voter.broadcast_times)
+    assert all(b - a >= 0.09 for a, b in zip(times, times[1:]))
+    stats = dispatcher.get_stats()
+    assert stats['dispatched'] == 4
+    assert stats['queue_depth'] == 0
+
+def test_retries_transient_failures():
+    voter = FakeVoter(failures=2)
+    dispatcher = VoteDispatcher(voter, num_workers=1, min_interval=0)
+    dispatcher.start()
+    dispatcher.dispatch([(FakeComment('@alice/a'), 100.0)])
+    wait_for(lambda: voter.voted)
+    dispatcher.stop()
+    assert voter.voted == ['@alice/a']
+    assert dispatcher.get_stats()['retries'] == 2
+
+def test_reports_failure_after_retries():
+    voter = FakeVoter(failures=dispatch.MAX_DISPATCH_RETRIES + 1)
+    dispatcher = VoteDispatcher(voter, num_workers=1, min_interval=0)
+    dispatcher.start()
+    dispatcher.dispatch([(FakeComment('@alice/a'), 100.0)])
+    wait_for(lambda: voter.failed)
+    dispatcher.stop()
+    assert voter.failed == ['@alice/a']
+    assert not dispatcher.is_pending('@alice/a')
+    assert dispatcher.get_stats()['failed'] == 1
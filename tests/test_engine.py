@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from grapheneapi.graphenewsrpc import RPCError
+
+from steemvote.engine import AsyncEngine
+from steemvote.voter import Voter
+
+class FakeVoter(Voter):
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.broadcast = []
+
+    def on_vote_broadcast(self, identifier, weight):
+        self.broadcast.append(identifier)
+
+class FakeEngine(AsyncEngine):
+    """Engine whose transactions are rejected if they vote on certain comments."""
+    def __init__(self, rejected):
+        self.voter = FakeVoter()
+        self.rejected = rejected
+        self.transactions = []
+
+    async def vote(self, votes):
+        self.transactions.append([i[0] for i in votes])
+        for identifier, _ in votes:
+            if identifier in self.rejected:
+                raise RPCError(self.rejected[identifier])
+
+def test_vote_batch_splits_rejected_transactions():
+    engine = FakeEngine({
+        '@alice/b': 'Cannot vote again on a comment after payout.',
+        '@alice/c': 'Bandwidth limit exceeded',
+    })
+    votes = [('@alice/%s' % i, 100.0) for i in 'abcd']
+    voted, failed = asyncio.run(engine.vote_batch(votes))
+    assert sorted(voted) == ['@alice/a', '@alice/b', '@alice/d']
+    assert failed == ['@alice/c']
+    assert sorted(engine.voter.broadcast) == ['@alice/a', '@alice/d']
+    assert engine.transactions[0] == ['@alice/a', '@alice/b', '@alice/c', '@alice/d']
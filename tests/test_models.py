@@ -0,0 +1,25 @@
+from steemvote.models import CommentSnapshot
+
+def make_snapshot(voters=()):
+    return CommentSnapshot('alice', 'a-post', 'steem', '', 1000, relevant_voters=voters)
+
+def test_snapshot_round_trip():
+    snapshot = make_snapshot(['carol', 'bob'])
+    assert snapshot.identifier == '@alice/a-post'
+    assert snapshot.permlink == 'a-post'
+    copy = CommentSnapshot.from_dict(snapshot.to_dict())
+    assert copy.identifier == snapshot.identifier
+    assert copy.relevant_voters == ('bob', 'carol')
+
+def test_snapshot_voters():
+    snapshot = make_snapshot(['bob'])
+    snapshot.add_voter('carol')
+    snapshot.add_voter('bob')
+    assert snapshot.get_have_voted(['bob', 'carol', 'dave']) == ['bob', 'carol']
+    snapshot.index_voters(['carol'])
+    assert snapshot.get_have_voted(['bob', 'carol']) == ['carol']
+
+def test_snapshot_names_are_shared():
+    first, second = make_snapshot(), CommentSnapshot(''.join(['ali', 'ce']), 'other', 'steem', '', 1000)
+    assert first.author is second.author
+    assert not hasattr(first, '__dict__')
@@ -0,0 +1,179 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+
+from grapheneapi.graphenewsrpc import RPCError
+import pytest
+
+from steemvote import rpcnode
+from steemvote.rpcnode import RPCPool
+
+class FakeRPC(object):
+    """RPC connection whose node can be taken down."""
+    down_nodes = set()
+    calls = []
+
+    def __init__(self, url, **kwargs):
+        self.url = url
+        if url in self.down_nodes:
+            raise Exception('Could not connect')
+
+    def wsconnect(self):
+        if self.url in self.down_nodes:
+            raise Exception('Could not connect')
+
+    def get_dynamic_global_properties(self):
+        if self.url in self.down_nodes:
+            raise Exception('Connection lost')
+        self.calls.append(self.url)
+        return {'head_block_number': 1}
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(rpcnode, 'SteemvoteRPC', FakeRPC)
+    monkeypatch.setattr(rpcnode, 'PROBE_INTERVAL', 3600)
+    FakeRPC.down_nodes = set()
+    FakeRPC.calls = []
+    return RPCPool(['ws://a', 'ws://b'], connections_per_node=2)
+
+def test_prefers_lowest_latency(pool):
+    for conn in pool.connections:
+        conn.latency = 0.5 if conn.url == 'ws://a' else 0.1
+    FakeRPC.calls = []
+    for _ in range(5):
+        pool.get_dynamic_global_properties()
+    assert set(FakeRPC.calls) == {'ws://b'}
+
+def test_fails_over_and_ejects(pool):
+    for conn in pool.connections:
+        conn.latency = 0.001 if conn.url == 'ws://a' else 0.002
+    FakeRPC.down_nodes.add('ws://a')
+    FakeRPC.calls = []
+    for _ in range(10):
+        assert pool.get_dynamic_global_properties()['head_block_number'] == 1
+    assert set(FakeRPC.calls) == {'ws://b'}
+    assert all(conn.ejected for conn in pool.connections if conn.url == 'ws://a')
+
+    # Ejected connections are reinstated once they respond to a probe.
+    FakeRPC.down_nodes.clear()
+    for conn in pool.connections:
+        pool.probe(conn)
+    assert len(pool.get_healthy_connections()) == 4
+
+def test_unavailable_node_at_startup(monkeypatch):
+    monkeypatch.setattr(rpcnode, 'SteemvoteRPC', FakeRPC)
+    FakeRPC.down_nodes = {'ws://a'}
+    pool = RPCPool(['ws://a', 'ws://b'], connections_per_node=1)
+    assert [conn.url for conn in pool.get_healthy_connections()] == ['ws://b']
+
+    FakeRPC.down_nodes = {'ws://a', 'ws://b'}
+    with pytest.raises(Exception):
+        RPCPool(['ws://a', 'ws://b'])
+
+class FakeWebsocket(object):
+    """Websocket that answers requests in reverse order."""
+    def __init__(self, batch_size, supports_batches=True):
+        self.batch_size = batch_size
+        self.supports_batches = supports_batches
+        self.messages_sent = 0
+        self.requests = []
+        self.responses = queue.Queue()
+        self.lock = threading.Lock()
+
+    def make_response(self, request):
+        method, args = request['params'][1:]
+        if method == 'fail':
+            return {'id': request['id'], 'error': {'message': 'failed'}}
+        return {'id': request['id'], 'result': args}
+
+    def send(self, data):
+        request = json.loads(data.decode('utf8'))
+        self.messages_sent += 1
+        if isinstance(request, list):
+            if self.supports_batches:
+                self.responses.put(json.dumps([self.make_response(i) for i in reversed(request)]))
+            else:
+                self.responses.put(json.dumps({'id': None, 'error': {'message': 'Parse error'}}))
+            return
+
+        with self.lock:
+            self.requests.append(request)
+            if len(self.requests) < self.batch_size:
+                return
+            requests, self.requests = self.requests, []
+        for request in reversed(requests):
+            self.responses.put(json.dumps(self.make_response(request)))
+
+    def recv(self):
+        return self.responses.get()
+
+def make_multiplexed_rpc(ws):
+    rpc = rpcnode.SteemvoteRPC.__new__(rpcnode.SteemvoteRPC)
+    rpc.logger = logging.getLogger(__name__)
+    rpc.batch_supported = True
+    rpc.request_ids = itertools.count(1)
+    rpc.send_lock = threading.Lock()
+    rpc.connect_lock = threading.RLock()
+    rpc.pending = {}
+    rpc.pending_lock = threading.Lock()
+    rpc.reader_ws = None
+    rpc.ws = ws
+    rpc.url = 'ws://a'
+    rpc.num_retries = 0
+    return rpc
+
+def test_concurrent_calls_are_routed_by_id():
+    num_threads = 8
+    rpc = make_multiplexed_rpc(FakeWebsocket(batch_size=num_threads))
+    results = {}
+    def call(i):
+        payload = {'method': 'call', 'params': [0, 'get_block', [i]], 'jsonrpc': '2.0', 'id': rpc.get_request_id()}
+        results[i] = rpc.rpcexec(payload)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == {i: [i] for i in range(num_threads)}
+
+def test_rpc_error_is_raised():
+    rpc = make_multiplexed_rpc(FakeWebsocket(batch_size=1))
+    with pytest.raises(RPCError):
+        rpc.rpcexec({'method': 'call', 'params': [0, 'fail', []], 'jsonrpc': '2.0', 'id': rpc.get_request_id()})
+
+def test_get_contents_batch():
+    ws = FakeWebsocket(batch_size=1)
+    rpc = make_multiplexed_rpc(ws)
+    identifiers = [('alice', 'post-%d' % i) for i in range(150)]
+    assert rpc.get_contents(identifiers) == [list(i) for i in identifiers]
+    # One message per chunk of MAX_BATCH_SIZE.
+    assert ws.messages_sent == 2
+
+def test_get_contents_without_batch_support():
+    ws = FakeWebsocket(batch_size=1, supports_batches=False)
+    rpc = make_multiplexed_rpc(ws)
+    identifiers = [('alice', 'post-%d' % i) for i in range(10)]
+    assert rpc.get_contents(identifiers) == [list(i) for i in identifiers]
+    assert not rpc.batch_supported
+
+def test_steem_connects_only_through_pool(monkeypatch):
+    monkeypatch.setattr(rpcnode, 'SteemvoteRPC', FakeRPC)
+    monkeypatch.setattr(rpcnode, 'PROBE_INTERVAL', 3600)
+    FakeRPC.down_nodes = set()
+    steem = rpcnode.SteemvoteSteem.__new__(rpcnode.SteemvoteSteem)
+    steem.rpc_nodes = None
+    steem.connections_per_node = 2
+    monkeypatch.setattr(rpcnode.Steem, '_connect', None, raising=False)
+    steem._connect(node='ws://a', rpcuser='user', rpcpassword='pass', nobroadcast=True)
+    assert isinstance(steem.rpc, RPCPool)
+    assert [conn.url for conn in steem.rpc.connections] == ['ws://a', 'ws://a']
+    assert steem.rpc.user == 'user'
+    assert steem.rpc.num_retries == rpcnode.DEFAULT_NUM_RETRIES
+
+    steem.rpc_nodes = ['ws://a', 'ws://b']
+    steem._connect(node='ws://a')
+    assert sorted(set(conn.url for conn in steem.rpc.connections)) == ['ws://a', 'ws://b']
+    assert steem.rpc.num_retries == 1
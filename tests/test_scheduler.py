@@ -0,0 +1,62 @@
+import threading
+import time
+
+from steemvote.scheduler import ExpiryWheel, VoteScheduler
+
+def test_pop_due_in_order():
+    scheduler = VoteScheduler()
+    scheduler.schedule('@alice/c', 30)
+    scheduler.schedule('@alice/a', 10)
+    scheduler.schedule('@alice/b', 20)
+    assert scheduler.pop_due(5) == []
+    assert scheduler.pop_due(25) == ['@alice/a', '@alice/b']
+    assert len(scheduler) == 1
+    assert scheduler.time_until_due(25) == 5
+
+def test_reschedule_replaces_due_time():
+    scheduler = VoteScheduler()
+    scheduler.schedule('@alice/a', 10)
+    scheduler.schedule('@alice/a', 50)
+    assert scheduler.pop_due(20) == []
+    assert scheduler.pop_due(50) == ['@alice/a']
+    assert scheduler.pop_due(100) == []
+
+def test_unschedule():
+    scheduler = VoteScheduler()
+    scheduler.schedule('@alice/a', 10)
+    scheduler.schedule('@alice/b', 10)
+    scheduler.unschedule(['@alice/a'])
+    assert '@alice/a' not in scheduler
+    assert scheduler.pop_due(10) == ['@alice/b']
+    assert scheduler.time_until_due(10) is None
+
+def test_wait_wakes_when_due_sooner():
+    scheduler = VoteScheduler()
+    scheduler.schedule('@alice/a', time.time() + 3600)
+    woken = []
+    scheduler.add_listener(lambda: woken.append(True))
+
+    started = time.time()
+    timer = threading.Timer(0.1, scheduler.schedule, args=('@alice/b', time.time()))
+    timer.start()
+    scheduler.wait(10)
+    timer.join()
+    assert time.time() - started < 5
+    assert woken == [True]
+
+def test_expiry_wheel():
+    wheel = ExpiryWheel(resolution=60)
+    wheel.add('@alice/a', 100)
+    wheel.add('@alice/b', 130)
+    wheel.add('@alice/c', 500)
+    wheel.add('@alice/d', 110)
+    wheel.remove(['@alice/d'])
+    assert wheel.pop_expired(50) == []
+    assert wheel.pop_expired(125) == ['@alice/a']
+    assert sorted(wheel.pop_expired(400)) == ['@alice/b']
+    assert len(wheel) == 1
+
+    # Comments older than the last cutoff can still be added.
+    wheel.add('@alice/e', 10)
+    assert sorted(wheel.pop_expired(1000)) == ['@alice/c', '@alice/e']
+    assert len(wheel) == 0
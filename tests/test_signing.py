@@ -0,0 +1,57 @@
+import pytest
+
+from steembase import transactions
+
+from steemvote import signing
+from steemvote.signing import EcdsaSigner, SigningService, SignerBackend, backends, get_backend
+from steemvote.transactions import create_vote_transaction
+
+# Throwaway key used only for testing.
+TEST_WIF = '5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3'
+TEST_PROPS = {
+    'head_block_number': 1,
+    'head_block_id': '0000000100000000000000000000000000000000',
+}
+
+def test_get_backend(monkeypatch):
+    monkeypatch.setattr(signing, 'secp256k1', None)
+    monkeypatch.setattr(signing, 'ecdsa', object())
+    assert isinstance(get_backend('auto'), EcdsaSigner)
+    assert isinstance(get_backend('ecdsa'), EcdsaSigner)
+    with pytest.raises(ValueError):
+        get_backend('secp256k1')
+    with pytest.raises(ValueError):
+        get_backend('unknown')
+
+def test_backends_must_sign():
+    with pytest.raises(TypeError):
+        SignerBackend()
+
+def test_invalid_processes():
+    with pytest.raises(ValueError):
+        SigningService(processes=-1)
+
+@pytest.mark.parametrize('cls', backends)
+def test_signatures(cls):
+    if not cls.is_available():
+        pytest.skip('%s backend is not available' % cls.name)
+    if not hasattr(transactions.Signed_Transaction, 'verify'):
+        pytest.skip('steembase cannot verify signatures')
+    tx = create_vote_transaction('steemvote', [('@alice/a', 100.0), ('@alice/b', 50.0)], TEST_PROPS)
+    tx = cls().sign(tx, TEST_WIF)
+    signatures = tx.data['signatures'].data
+    assert len(signatures) == 1
+    assert tx._is_canonical(bytes(signatures[0])[1:])
+    # verify() raises an exception if the key's signature is missing.
+    assert tx.verify([transactions.PrivateKey(TEST_WIF).pubkey], 'STEEM')
+
+@pytest.mark.parametrize('processes', [0, 2])
+def test_build_vote_transactions(processes):
+    service = SigningService(processes=processes)
+    try:
+        batches = [([('@alice/%d' % i, 100.0)], 60) for i in range(20)]
+        txs = service.build_vote_transactions('steemvote', batches, TEST_PROPS, TEST_WIF)
+        assert [tx['operations'][0][1]['permlink'] for tx in txs] == [str(i) for i in range(20)]
+        assert service.build_vote_transactions('steemvote', [], TEST_PROPS, TEST_WIF) == []
+    finally:
+        service.shutdown()
@@ -0,0 +1,26 @@
+from importlib.machinery import SourceFileLoader
+import os
+
+from steemvote.config import Config
+from steemvote.models import Author, Delegate
+from steemvote.voter import Voter
+
+steemvoter = SourceFileLoader('steemvoter',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'steemvoter')).load_module()
+
+def test_print_config(tmpdir, capsys):
+    config = Config(no_saving=True)
+    config.set('voter_account_name', 'me')
+    config.set('vote_key', '5K')
+    config.set('database_path', str(tmpdir.join('test.db')))
+    config.set('blacklist_authors', ['spammer'])
+    config.set_authors([Author('alice')], save=False)
+    config.set_delegates([Delegate('bob')], save=False)
+    voter = Voter(config)
+    try:
+        steemvoter.print_config(voter)
+    finally:
+        voter.close()
+    out = capsys.readouterr().out
+    assert "Blacklisted authors" in out and "'spammer'" in out
+    assert "'alice'" in out and "'bob'" in out
@@ -0,0 +1,169 @@
+import logging
+import time
+
+from grapheneapi.graphenewsrpc import RPCError
+import pytest
+
+from steemvote.config import Config
+from steemvote.models import Delegate
+
+from steemvote.transactions import MIN_PRESIGNED_LIFETIME, PresignedVotes
+from steemvote.voter import (MAX_VOTE_ATTEMPTS, STEEMIT_VOTE_REGENERATION_SECONDS, VOTE_RETRY_DELAY,
+        ShouldVote, Voter, VotingPower)
+
+def test_regeneration():
+    power = VotingPower(5000, 1000)
+    assert power.get(1000) == 0.5
+    assert power.get(1000 + STEEMIT_VOTE_REGENERATION_SECONDS // 4) == 0.75
+    # Voting power cannot exceed 100%.
+    assert power.get(1000 + STEEMIT_VOTE_REGENERATION_SECONDS) == 1.0
+
+def test_apply_vote():
+    power = VotingPower(10000, 1000)
+    # A full-weight vote uses 1/200th of the current power, rounded up.
+    power.apply_vote(10000, 2000)
+    assert power.voting_power == 9950
+    assert power.last_vote_time == 2000
+    # Downvotes use power too.
+    power.apply_vote(-5000, 2000)
+    assert power.voting_power == 9925
+
+    # A vote seen after a later one does not move the last vote time back.
+    power.apply_vote(10000, 1500)
+    assert power.last_vote_time == 2000
+    assert power.voting_power == 9875
+
+class BatchVoter(Voter):
+    """Voter whose transactions are rejected if they vote on certain comments."""
+    def __init__(self, rejected):
+        self.logger = logging.getLogger(__name__)
+        self.rejected = rejected
+        self.transactions = []
+        self.broadcast = []
+
+    def _vote(self, votes):
+        self.transactions.append([i[0] for i in votes])
+        for identifier, _ in votes:
+            if identifier in self.rejected:
+                raise RPCError(self.rejected[identifier])
+
+    def on_vote_broadcast(self, identifier, weight):
+        self.broadcast.append(identifier)
+
+def test_vote_batch_splits_rejected_transactions():
+    voter = BatchVoter({
+        '@alice/b': 'Cannot vote again on a comment after payout.',
+        '@alice/c': 'Changing your vote requires a different weight.',
+    })
+    votes = [('@alice/%s' % i, 100.0) for i in 'abcd']
+    slots = []
+    voted, failed = voter.vote_batch(votes, lambda: slots.append(len(voter.transactions)))
+    assert sorted(voted) == ['@alice/a', '@alice/b', '@alice/c', '@alice/d']
+    assert failed == []
+    assert sorted(voter.broadcast) == ['@alice/a', '@alice/d']
+    assert voter.transactions[0] == ['@alice/a', '@alice/b', '@alice/c', '@alice/d']
+    # Every transaction waits for a broadcast slot.
+    assert slots == list(range(len(voter.transactions)))
+
+def test_vote_batch_reports_failures():
+    voter = BatchVoter({'@alice/b': 'Bandwidth limit exceeded'})
+    voted, failed = voter.vote_batch([('@alice/a', 100.0), ('@alice/b', 100.0)])
+    assert voted == ['@alice/a']
+    assert failed == ['@alice/b']
+
+def test_presigned_votes():
+    votes = PresignedVotes()
+    votes.put('@alice/a', 100.0, 'tx-a', 1000)
+    votes.put('@alice/b', 100.0, 'tx-b', 1000)
+    votes.put('@alice/c', 100.0, 'tx-c', 1000)
+    assert votes.take('@alice/a', 100.0, now=900) == 'tx-a'
+    assert '@alice/a' not in votes
+    # Transactions with a different weight are not used.
+    assert votes.take('@alice/b', 50.0, now=900) is None
+    # Transactions that expire too soon are not used.
+    assert votes.take('@alice/c', 100.0, now=1000 - MIN_PRESIGNED_LIFETIME + 1) is None
+    assert len(votes) == 0
+
+class FakeComment(object):
+    def __init__(self, identifier, timestamp):
+        self.identifier = identifier
+        self.timestamp = timestamp
+        self.author, self.permlink = identifier[1:].split('/')
+        self.category = 'steem'
+        self.parent_author = ''
+        self.allow_votes = True
+        self.allow_curation_rewards = True
+        self.relevant_voters = set()
+
+@pytest.fixture
+def voter(tmpdir):
+    config = Config(no_saving=True)
+    config.set('voter_account_name', 'me')
+    config.set('vote_key', '5K')
+    config.set('database_path', str(tmpdir.join('test.db')))
+    voter = Voter(config)
+    voter.dispatched = []
+    voter.dispatcher.dispatch = voter.dispatched.extend
+    yield voter
+    voter.close()
+
+def test_vote_now(voter):
+    comment = FakeComment('@alice/a', 1000)
+    voter.db.add_comment_with_delegate(comment, 'bob')
+    voter.schedule_comment(comment)
+    voter.get_voting_weight = lambda comment: 50.0
+
+    voter.should_vote = lambda comment: ShouldVote(False, True, 'no delegates with a high enough priority')
+    assert not voter.vote_now(comment.identifier)
+    assert comment.identifier in voter.scheduler
+
+    voter.should_vote = lambda comment: ShouldVote(True, True, '')
+    assert voter.vote_now(comment.identifier)
+    assert [(i.identifier, weight) for i, weight in voter.dispatched] == [(comment.identifier, 50.0)]
+    assert comment.identifier not in voter.scheduler
+
+def test_load_settings_swaps_rules(voter):
+    rules = voter.rules
+    with pytest.raises(AttributeError):
+        rules.min_post_age = 0
+
+    voter.config.set_delegates([Delegate('bob')])
+    voter.config.set('min_post_age', 120)
+    voter.load_settings()
+    # Rules that were already taken are not changed.
+    assert rules.min_post_age == 60
+    assert 'bob' not in rules.watched_voters
+    assert voter.rules.min_post_age == 120
+    assert voter.rules.watched_voters == frozenset(['bob', 'me'])
+
+def test_failed_votes_back_off(voter):
+    comment = FakeComment('@alice/a', 1000)
+    voter.db.add_comment_with_delegate(comment, 'bob')
+    retry_times = []
+    for _ in range(MAX_VOTE_ATTEMPTS - 1):
+        started = time.time()
+        voter.record_voting_results([], [], [comment])
+        retry_times.append(voter.scheduler.get_due_time(comment.identifier) - started)
+    assert [round(i) for i in retry_times] == [VOTE_RETRY_DELAY * 2 ** i for i in range(MAX_VOTE_ATTEMPTS - 1)]
+
+    # The comment is no longer tracked after too many failures.
+    voter.record_voting_results([], [], [comment])
+    assert comment.identifier not in voter.scheduler
+    assert not voter.db.get_tracked_comment(comment.identifier)
+    assert voter.vote_failures == {}
+
+def test_refresh_does_not_hold_voting_lock(voter):
+    comment = FakeComment('@alice/a', 1000)
+    voter.db.add_comment_with_delegate(comment, 'bob')
+    voter.schedule_comment(comment)
+    voter.steem = object()
+    lock_free = []
+    def refresh_stale_comments(identifiers):
+        # vote_now() can run while comments are refreshed.
+        acquired = voter.voting_lock.acquire(blocking=False)
+        if acquired:
+            voter.voting_lock.release()
+        lock_free.append(acquired)
+    voter.refresh_stale_comments = refresh_stale_comments
+    voter.vote_for_comments()
+    assert lock_free == [True]